@@ -0,0 +1,221 @@
+import socket
+import threading
+import time
+
+from orwell.client import async_logging
+from orwell.client.clock import monotonic
+from orwell.client.device import Device
+
+LOGGER = None
+
+
+# Bounded buffer with one producer thread and one consumer thread. Each side
+# only writes its own counter so no lock is needed; when the producer is more
+# than capacity items ahead the oldest items are lost (and counted).
+class RingBuffer(object):
+    def __init__(self, capacity=64):
+        assert(capacity > 1)
+        self._capacity = capacity
+        self._slots = [None] * capacity
+        # only changed by the producer
+        self._written = 0
+        # only changed by the consumer
+        self._read = 0
+        self._overruns = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def written(self):
+        return self._written
+
+    @property
+    def overruns(self):
+        return self._overruns
+
+    def __len__(self):
+        return min(self._written - self._read, self._capacity - 1)
+
+    def push(self, item):
+        self._slots[self._written % self._capacity] = item
+        self._written += 1
+
+    def latest(self):
+        written = self._written
+        if (0 == written):
+            return None
+        return self._slots[(written - 1) % self._capacity]
+
+    def pop_all(self):
+        written = self._written
+        # the oldest slot may be overwritten while it is read
+        start = max(self._read, written - self._capacity + 1)
+        self._overruns += start - self._read
+        items = [
+            self._slots[index % self._capacity]
+            for index in range(start, written)]
+        self._read = written
+        return items
+
+
+# Runs a device on an acquisition thread: the wrapped device is processed
+# there and every new Input (or ping) is pushed with its timestamp in a ring
+# buffer. The Runner only reads the newest sample, it never waits for the
+# device. A socket pair wakes the event loop up when a sample arrives.
+class ThreadedDevice(Device):
+    # in case the wake up is missed
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, device, capacity=64):
+        self._device = device
+        self._buffer = RingBuffer(capacity)
+        self._wake_up_reader, self._wake_up_writer = socket.socketpair()
+        self._wake_up_reader.setblocking(False)
+        self._wake_up_writer.setblocking(False)
+        self._input = None
+        self._timestamp = None
+        self._has_new_values = False
+        self._ping = False
+
+    @property
+    def device(self):
+        return self._device
+
+    @property
+    def buffer(self):
+        return self._buffer
+
+    @property
+    def timestamp(self):
+        # when the last Input returned by build_input was read from the device
+        return self._timestamp
+
+    def acquire(self):
+        # called from the acquisition thread
+        device = self._device
+        device.process()
+        input_ = None
+        if (device.has_new_values):
+            input_ = device.build_input()
+        ping = device.read_ping()
+        if ((input_ is None) and (not ping)):
+            return
+        was_empty = (0 == len(self._buffer))
+        self._buffer.push((monotonic(), input_, ping))
+        if (was_empty):
+            try:
+                self._wake_up_writer.send(b"\0")
+            except socket.error:
+                # the reader has not been drained yet, it is awake anyway
+                pass
+
+    def process(self):
+        try:
+            while (self._wake_up_reader.recv(512)):
+                pass
+        except socket.error:
+            pass
+        self._has_new_values = False
+        for timestamp, input_, ping in self._buffer.pop_all():
+            if (input_ is not None):
+                self._input = input_
+                self._timestamp = timestamp
+                self._has_new_values = True
+            if (ping):
+                self._ping = True
+
+    @property
+    def has_new_values(self):
+        return self._has_new_values
+
+    def build_input(self):
+        return self._input
+
+    def read_ping(self):
+        if (self._ping):
+            self._ping = False
+            return True
+        else:
+            return False
+
+    @property
+    def poll_sources(self):
+        return [self._wake_up_reader.fileno()]
+
+    @property
+    def poll_interval(self):
+        return ThreadedDevice.POLL_INTERVAL
+
+    @property
+    def acquisition_interval(self):
+        interval = self._device.poll_interval
+        if (interval is None):
+            interval = AcquisitionPool.DEFAULT_INTERVAL
+        return interval
+
+    def close(self):
+        self._wake_up_reader.close()
+        self._wake_up_writer.close()
+
+
+# Spreads the devices over a few acquisition threads, each thread processing
+# its devices at the shortest poll interval among them.
+class AcquisitionPool(object):
+    DEFAULT_INTERVAL = 0.005
+
+    def __init__(self, devices, threads=1, capacity=64):
+        assert(threads > 0)
+        self._devices = [ThreadedDevice(device, capacity) for device in devices]
+        threads = min(threads, max(1, len(devices)))
+        self._groups = [
+            self._devices[index::threads] for index in range(threads)]
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def devices(self):
+        # to give to the Runner instead of the wrapped devices
+        return list(self._devices)
+
+    def start(self):
+        self._stop.clear()
+        for index, group in enumerate(self._groups):
+            thread = threading.Thread(
+                target=self._run,
+                args=(group,),
+                name="acquisition-" + str(index))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def close(self):
+        self.stop()
+        for device in self._devices:
+            device.close()
+
+    def _run(self, group):
+        interval = min(device.acquisition_interval for device in group)
+        while (not self._stop.is_set()):
+            started = monotonic()
+            for device in group:
+                try:
+                    device.acquire()
+                except Exception:
+                    LOGGER.exception("failed to read " + str(device.device))
+            remaining = interval - (monotonic() - started)
+            if (remaining > 0):
+                time.sleep(remaining)
+
+
+def configure_logging(verbose):
+    global LOGGER
+    # records are formatted and written by the logging thread
+    LOGGER = async_logging.configure(__name__, verbose)
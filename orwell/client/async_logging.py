@@ -0,0 +1,191 @@
+import array
+import logging
+import os
+import struct
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from orwell.client.clock import monotonic
+
+FORMAT = '%(asctime)s %(name)-12s %(levelname)-8s %(message)s'
+
+
+# Only puts the record in a queue: the message is formatted (its arguments
+# included) and written by the listener thread.
+class QueueHandler(logging.Handler):
+    def __init__(self, record_queue):
+        logging.Handler.__init__(self)
+        self._queue = record_queue
+
+    @property
+    def queue(self):
+        return self._queue
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # better lose a line than block the loop
+            pass
+
+
+class QueueListener(object):
+    def __init__(self, record_queue, handlers):
+        self._queue = record_queue
+        self._handlers = handlers
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="logging")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        # what is already queued is written before the thread ends
+        if (self._thread is not None):
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if (record is None):
+                break
+            for handler in self._handlers:
+                if (record.levelno >= handler.level):
+                    handler.handle(record)
+
+
+_LOCK = threading.Lock()
+_QUEUE = None
+_LISTENER = None
+# process that started the listener: a forked child inherits the queue but
+# not the thread reading it
+_PID = None
+
+
+def _get_queue():
+    # one listener thread and one stream handler shared by every logger
+    global _QUEUE, _LISTENER, _PID
+    with _LOCK:
+        if ((_QUEUE is None) or (os.getpid() != _PID)):
+            _PID = os.getpid()
+            _QUEUE = queue.Queue(maxsize=65536)
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(FORMAT))
+            _LISTENER = QueueListener(_QUEUE, [handler])
+            _LISTENER.start()
+        return _QUEUE
+
+
+def configure(name, verbose):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    record_queue = _get_queue()
+    for handler in list(logger.handlers):
+        if ((isinstance(handler, QueueHandler)) and
+                (handler.queue is not record_queue)):
+            # configured before a fork
+            logger.removeHandler(handler)
+    if (not any(isinstance(handler, QueueHandler)
+                for handler in logger.handlers)):
+        logger.addHandler(QueueHandler(record_queue))
+    if (verbose):
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+    return logger
+
+
+def shutdown():
+    global _QUEUE, _LISTENER
+    with _LOCK:
+        if (_LISTENER is not None):
+            _LISTENER.stop()
+        _QUEUE = None
+        _LISTENER = None
+
+
+MAGIC = b"ORWEVT"
+VERSION = 1
+HEADER = struct.Struct("<6sBBI")
+
+
+# Fixed size binary trace of the last events of the loop: recording one is
+# three array stores, nothing is formatted until the ring is dumped. Events
+# are small integer codes registered by name, with one float value each.
+class EventRing(object):
+    def __init__(self, capacity=65536):
+        assert(capacity > 0)
+        self._capacity = capacity
+        self._times = array.array("d", [0.0]) * capacity
+        self._codes = array.array("H", [0]) * capacity
+        self._values = array.array("d", [0.0]) * capacity
+        self._written = 0
+        self._names = []
+        self._codes_by_name = {}
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def written(self):
+        return self._written
+
+    def register(self, name):
+        code = self._codes_by_name.get(name)
+        if (code is None):
+            code = len(self._names)
+            self._names.append(name)
+            self._codes_by_name[name] = code
+        return code
+
+    def record(self, code, value=0.0):
+        index = self._written % self._capacity
+        self._times[index] = monotonic()
+        self._codes[index] = code
+        self._values[index] = value
+        self._written += 1
+
+    def _indices(self):
+        start = max(0, self._written - self._capacity)
+        return [
+            index % self._capacity for index in range(start, self._written)]
+
+    def events(self):
+        # (time, name, value), oldest first
+        return [
+            (self._times[index],
+                self._names[self._codes[index]],
+                self._values[index])
+            for index in self._indices()]
+
+    def dump(self, path):
+        indices = self._indices()
+        names = "\n".join(self._names).encode("utf-8")
+        byte_order = 0 if ("little" == sys.byteorder) else 1
+        with open(path, "wb") as dump_file:
+            dump_file.write(
+                HEADER.pack(MAGIC, VERSION, byte_order, len(indices)))
+            dump_file.write(struct.pack("<I", len(names)))
+            dump_file.write(names)
+            for column in (self._times, self._codes, self._values):
+                ordered = array.array(
+                    column.typecode, (column[index] for index in indices))
+                if (hasattr(ordered, "tobytes")):
+                    dump_file.write(ordered.tobytes())
+                else:
+                    dump_file.write(ordered.tostring())
+        return len(indices)
+
+    def __str__(self):
+        return "\n".join(
+            "{0:.6f} {1} {2}".format(time_, name, value)
+            for time_, name, value in self.events())
@@ -0,0 +1,430 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import itertools
+import json
+import logging
+import sys
+import threading
+import time
+
+import zmq
+
+import orwell.messages.controller_pb2 as pb_controller
+import orwell.messages.server_game_pb2 as pb_server_game
+
+from orwell.client import async_logging
+from orwell.client import runner as runner_module
+from orwell.client.broadcast import Broadcast
+from orwell.client.clock import monotonic
+from orwell.client.clock import process_time
+from orwell.client.clock import thread_time
+from orwell.client import framing
+from orwell.client import fake_server
+from orwell.client.fake_server import FakeServer
+from orwell.client.fake_server import build_discovery_reply
+from orwell.client import handshake
+from orwell.client.input import Input
+from orwell.client.latency import Histogram
+from orwell.client.message_wrapper import MessageWrapper
+from orwell.client.mixing import MixingEngine
+from orwell.client.mixing import ResponseCurve
+from orwell.client.recording import ReplayDevice
+from orwell.client.recording import load_recording
+from orwell.client.scripted_device import ScriptedDevice
+from orwell.client.scripted_device import build_sweep
+
+ROUTING_ID = "benchmark_client"
+# inproc endpoints need a different name each time a Runner is benchmarked
+ENDPOINT_IDS = itertools.count()
+
+
+class BenchmarkResult(object):
+    def __init__(self, name, count, wall_time, cpu_time, latency=None):
+        self.name = name
+        self.count = count
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.latency = latency
+
+    @property
+    def messages_per_second(self):
+        if (0 == self.wall_time):
+            return 0.0
+        return self.count / self.wall_time
+
+    @property
+    def cpu_per_message(self):
+        if (self.cpu_time is None):
+            return None
+        if (0 == self.count):
+            return 0.0
+        return self.cpu_time / self.count
+
+    def to_dict(self):
+        result = {
+            "count": self.count,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "messages_per_second": self.messages_per_second,
+            "cpu_per_message": self.cpu_per_message,
+        }
+        if (self.latency is not None):
+            result["latency"] = self.latency.summary()
+        return result
+
+    def __str__(self):
+        if (self.cpu_time is None):
+            cpu = "{0:>10}".format("-")
+        else:
+            cpu = "{0:>10.2f}".format(self.cpu_per_message * 1e6)
+        text = "{name:<24} {rate:>12.0f} msg/s {cpu} us cpu/msg".format(
+            name=self.name,
+            rate=self.messages_per_second,
+            cpu=cpu)
+        if (self.latency is not None):
+            text += "  input to wire " + str(self.latency)
+        return text
+
+
+def measure(name, count, function):
+    wall_start = monotonic()
+    cpu_start = process_time()
+    function()
+    cpu_time = process_time() - cpu_start
+    wall_time = monotonic() - wall_start
+    return BenchmarkResult(name, count, wall_time, cpu_time)
+
+
+def bench_input_get_message(iterations):
+    samples = build_sweep(iterations)
+
+    def run():
+        for left, right, fire_weapon1, fire_weapon2, _ in samples:
+            Input(left, right, fire_weapon1, fire_weapon2).get_message(
+                ROUTING_ID)
+    return measure("Input.get_message", iterations, run)
+
+
+def build_game_state_payload(teams=2):
+    game_state = pb_server_game.GameState()
+    game_state.playing = True
+    game_state.seconds = 120
+    for index in range(teams):
+        team = game_state.teams.add()
+        team.name = "team_" + str(index)
+        team.num_players = 2
+        team.score = index
+    return game_state.SerializeToString()
+
+
+def bench_message_wrapper(iterations):
+    message = ROUTING_ID + " GameState " + build_game_state_payload()
+
+    def run():
+        for _ in range(iterations):
+            MessageWrapper(message).message
+    return measure("MessageWrapper", iterations, run)
+
+
+def bench_broadcast_decode_data(iterations):
+    # decode_data only needs the received datagram and its sender
+    broadcast = Broadcast.__new__(Broadcast)
+    broadcast._data = build_discovery_reply(
+        "tcp://*:9000", "tcp://*:9001", "tcp://*:9004")
+    broadcast._sender = ("127.0.0.1", 9080)
+
+    def run():
+        for _ in range(iterations):
+            broadcast.decode_data()
+    return measure("Broadcast.decode_data", iterations, run)
+
+
+class FakePygameJoystick(object):
+    def get_name(self):
+        return "xinput"
+
+    def get_init(self):
+        return True
+
+    def get_id(self):
+        return 0
+
+    def get_numaxes(self):
+        return 8
+
+    def get_numbuttons(self):
+        return 12
+
+    def get_axis(self, axis):
+        return 0.0
+
+    def get_button(self, button):
+        return 0
+
+    def quit(self):
+        pass
+
+
+def bench_joystick_convert(iterations):
+    # pygame is only needed for this benchmark
+    from orwell.client.joystick import Joystick
+    joystick = Joystick(
+        FakePygameJoystick(), dead_zone=0.05, angle=0.7, precision=0.025)
+    samples = build_sweep(iterations)
+
+    def run():
+        for left, right, _, _, _ in samples:
+            joystick._convert(left, right, 1.0)
+    return measure("Joystick._convert", iterations, run)
+
+
+def build_mixing_engine():
+    return MixingEngine(
+        dead_zone=0.05,
+        x_curve=ResponseCurve(dead_zone=0.02, expo=0.3),
+        y_curve=ResponseCurve(dead_zone=0.02, expo=0.3))
+
+
+def bench_mixing(iterations):
+    mixer = build_mixing_engine()
+    samples = build_sweep(iterations)
+
+    def run():
+        for left, right, _, _, _ in samples:
+            mixer.mix(left, right, 1.0)
+    return measure("MixingEngine.mix", iterations, run)
+
+
+def bench_mixing_batch(iterations):
+    mixer = build_mixing_engine()
+    samples = build_sweep(iterations)
+    xs = [sample[0] for sample in samples]
+    ys = [sample[1] for sample in samples]
+    factors = [1.0] * iterations
+    return measure(
+        "MixingEngine.mix_batch",
+        iterations,
+        lambda: mixer.mix_batch(xs, ys, factors))
+
+
+def _sample_key(left, right, fire_weapon1, fire_weapon2):
+    # the payload carries 32 bits floats
+    return (
+        round(left, 4), round(right, 4), bool(fire_weapon1), bool(fire_weapon2))
+
+
+def pair_latencies(produced, received):
+    # produced: (timestamp, values) of each new value of the device, in
+    # order ; received: (timestamp, frames) of each message read by the server.
+    # Input messages have no room for a sequence number so the sequence is
+    # the order of production: each Input received is paired with the next
+    # produced sample with the same values, the ones skipped were dropped or
+    # coalesced on the way.
+    latency = Histogram()
+    produced = list(produced)
+    position = 0
+    for received_at, frames in received:
+        if ((produced) and (received_at < produced[0][0])):
+            # produced before the oldest timestamp kept by the device
+            continue
+        message_wrapper = framing.unwrap(frames)
+        if ((message_wrapper is None) or
+                ("Input" != message_wrapper.message_type)):
+            continue
+        pb_input = pb_controller.Input()
+        pb_input.ParseFromString(message_wrapper.payload)
+        key = _sample_key(
+            pb_input.move.left,
+            pb_input.move.right,
+            pb_input.fire.weapon1,
+            pb_input.fire.weapon2)
+        index = position
+        while ((index < len(produced)) and
+                (_sample_key(*produced[index][1]) != key)):
+            index += 1
+        if (index == len(produced)):
+            # not produced by this device (or already paired)
+            continue
+        latency.record(received_at - produced[index][0])
+        position = index + 1
+    return latency
+
+
+def bench_runner(duration, event_driven, recording=None):
+    suffix = str(next(ENDPOINT_IDS))
+    # shared by the server and the runner, which then leaves it alone
+    context = zmq.Context.instance()
+    server = FakeServer(
+        push_address="inproc://benchmark-push-" + suffix,
+        subscribe_address="inproc://benchmark-subscribe-" + suffix,
+        reply_address="inproc://benchmark-reply-" + suffix,
+        discovery_port=None,
+        game_state_rate=None,
+        context=context,
+        record_inputs=True)
+    server.start()
+    if (event_driven):
+        name = "Runner.run (event loop)"
+        interval = 0.001
+    else:
+        name = "Runner.run (busy loop)"
+        interval = None
+    if (recording is None):
+        device = ScriptedDevice(
+            build_sweep(10000), interval=interval, keep_timestamps=True)
+    else:
+        # one sample per loop so that every run plays the same inputs
+        device = ReplayDevice(
+            recording, realtime=False, loop=True, keep_timestamps=True)
+    runner = runner_module.Runner(
+        [device],
+        push_address=server.push_address,
+        subscribe_address=server.subscribe_address,
+        reply_address=server.reply_address,
+        event_driven=event_driven,
+        context=context)
+    timer = threading.Timer(duration, runner.stop)
+    wall_start = monotonic()
+    # the fake server runs in the same process: only the processor time of
+    # this thread, the one running the client, is measured when possible,
+    # otherwise the one of the process (server included) is an upper bound
+    cpu_clock = thread_time
+    if (cpu_clock is None):
+        cpu_clock = process_time
+    cpu_start = cpu_clock()
+    timer.start()
+    runner.run()
+    cpu_time = cpu_clock() - cpu_start
+    # give the server some time to read what is still queued
+    deadline = monotonic() + 0.5
+    while ((len(server.received) < len(device.timestamps)) and
+            (monotonic() < deadline)):
+        time.sleep(0.01)
+    wall_time = monotonic() - wall_start
+    # disconnect before the server closes the inproc endpoints
+    runner.destroy()
+    server.stop()
+    latency = pair_latencies(device.timestamps, server.received)
+    return BenchmarkResult(
+        name, len(server.received), wall_time, cpu_time, latency)
+
+
+def run_all(iterations, duration, only=None, recording=None):
+    benchmarks = [
+        ("input", lambda: bench_input_get_message(iterations)),
+        ("message_wrapper", lambda: bench_message_wrapper(iterations)),
+        ("broadcast", lambda: bench_broadcast_decode_data(iterations)),
+        ("joystick", lambda: bench_joystick_convert(iterations)),
+        ("mixing", lambda: bench_mixing(iterations)),
+        ("mixing_batch", lambda: bench_mixing_batch(iterations)),
+        ("runner", lambda: bench_runner(duration, False, recording)),
+        ("runner_event", lambda: bench_runner(duration, True, recording)),
+    ]
+    results = []
+    for key, benchmark in benchmarks:
+        if ((only) and (key not in only)):
+            continue
+        result = benchmark()
+        print(str(result))
+        results.append(result)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # returns the names of the benchmarks that got slower than the baseline
+    # by more than tolerance (a ratio)
+    regressions = []
+    for result in results:
+        reference = baseline.get(result.name)
+        if ((reference is None) or (not reference["messages_per_second"])):
+            continue
+        current = result.to_dict()
+        ratio = (current["messages_per_second"] /
+                 reference["messages_per_second"])
+        text = "{name:<24} throughput {ratio:+.1%}".format(
+            name=result.name, ratio=ratio - 1)
+        regressed = (ratio < 1 - tolerance)
+        if (("latency" in current) and ("latency" in reference) and
+                (reference["latency"]["p99"])):
+            latency_ratio = (current["latency"]["p99"] /
+                             reference["latency"]["p99"])
+            text += "; p99 latency {ratio:+.1%}".format(
+                ratio=latency_ratio - 1)
+            regressed = regressed or (latency_ratio > 1 + tolerance)
+        if (regressed):
+            text += "  REGRESSION"
+            regressions.append(result.name)
+        print(text)
+    return regressions
+
+
+def parse():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the client hot paths offline.')
+    parser.add_argument(
+        '--iterations',
+        help='Number of iterations of the micro benchmarks',
+        type=int,
+        default=100000)
+    parser.add_argument(
+        '--duration',
+        help='Duration in seconds of each Runner benchmark',
+        type=float,
+        default=5.0)
+    parser.add_argument(
+        '--only',
+        help='Only run these benchmarks (input, message_wrapper, broadcast, '
+        'joystick, mixing, mixing_batch, runner, runner_event)',
+        nargs='+',
+        default=None)
+    parser.add_argument(
+        '--recording',
+        help='Feed the Runner benchmarks with this recording instead of a '
+        'synthetic sweep',
+        default=None)
+    parser.add_argument(
+        '--save-baseline',
+        help='Write the results to this file',
+        default=None)
+    parser.add_argument(
+        '--baseline',
+        help='Compare the results with the ones saved in this file',
+        default=None)
+    parser.add_argument(
+        '--tolerance',
+        help='Relative slow down accepted when comparing with the baseline',
+        type=float,
+        default=0.1)
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse()
+    for module in (runner_module, handshake, fake_server):
+        module.configure_logging(False)
+        logging.getLogger(module.__name__).setLevel(logging.WARNING)
+    recording = None
+    if (arguments.recording):
+        recording = load_recording(arguments.recording)
+    results = run_all(
+        arguments.iterations, arguments.duration, arguments.only, recording)
+    if (arguments.save_baseline):
+        with open(arguments.save_baseline, "w") as baseline_file:
+            json.dump(
+                dict((result.name, result.to_dict()) for result in results),
+                baseline_file,
+                indent=2,
+                sort_keys=True)
+    regressions = []
+    if (arguments.baseline):
+        with open(arguments.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, arguments.tolerance)
+    async_logging.shutdown()
+    if (regressions):
+        sys.exit(1)
+
+
+if ("__main__" == __name__):
+    main()
@@ -1,9 +1,17 @@
-from __future__ import print_function
 import socket
 import struct
-import sys
-# @TODO ? implement proper broadcast address finding
-# import netifaces
+import threading
+
+from orwell.client import async_logging
+from orwell.client.clock import monotonic
+
+try:
+    import netifaces
+except ImportError:
+    # only the interface used to reach the broadcast address can be probed
+    netifaces = None
+
+LOGGER = None
 
 
 def get_network_ip():
@@ -13,6 +21,162 @@ def get_network_ip():
     return s.getsockname()[0]
 
 
+def get_broadcast_addresses():
+    addresses = []
+    if (netifaces is not None):
+        for interface in netifaces.interfaces():
+            inet_addresses = netifaces.ifaddresses(interface).get(
+                netifaces.AF_INET, [])
+            for inet_address in inet_addresses:
+                broadcast = inet_address.get('broadcast')
+                if ((broadcast) and (broadcast not in addresses)):
+                    addresses.append(broadcast)
+    if (not addresses):
+        broadcast = get_network_ip().split('.')
+        addresses.append('.'.join(broadcast[:-1] + ['255']))
+    return addresses
+
+
+# tags of the puller, publisher and replier addresses, in this order
+DISCOVERY_TAGS = (0xa0, 0xa1, 0xa2)
+DISCOVERY_END = 0x00
+
+
+class DecodingError(ValueError):
+    pass
+
+
+def decode_data(data, sender):
+    # data (split on multiple lines for clarity):
+    # 0xA0
+    # size on 8 bytes
+    # Address of puller
+    # 0xA1
+    # size on 8 bytes
+    # Address of publisher
+    # 0xA2
+    # size on 8 bytes
+    # Address of replier
+    # 0x00
+    data = bytearray(data)
+    addresses = []
+    position = 0
+    for tag in DISCOVERY_TAGS:
+        if (position + 2 > len(data)):
+            raise DecodingError(
+                "reply truncated before tag 0x{0:02x}".format(tag))
+        if (data[position] != tag):
+            raise DecodingError(
+                "expected tag 0x{0:02x} at {1}, got 0x{2:02x}".format(
+                    tag, position, data[position]))
+        start = position + 2
+        end = start + data[position + 1]
+        if (end > len(data)):
+            raise DecodingError(
+                "address of tag 0x{0:02x} goes past the end of the "
+                "reply".format(tag))
+        try:
+            addresses.append(bytes(data[start:end]).decode("ascii"))
+        except UnicodeDecodeError:
+            raise DecodingError(
+                "address of tag 0x{0:02x} is not ascii".format(tag))
+        position = end
+    if ((position < len(data)) and (data[position] != DISCOVERY_END)):
+        raise DecodingError(
+            "unexpected byte 0x{0:02x} after the addresses".format(
+                data[position]))
+    sender_ip, _ = sender
+    return tuple(address.replace('*', sender_ip) for address in addresses)
+
+
+class ServerCandidate(object):
+    def __init__(self, sender, addresses, round_trip):
+        self._sender = sender
+        self._addresses = addresses
+        self._round_trip = round_trip
+
+    @property
+    def sender(self):
+        return self._sender
+
+    @property
+    def addresses(self):
+        return self._addresses
+
+    @property
+    def push_address(self):
+        return self._addresses[0]
+
+    @property
+    def subscribe_address(self):
+        return self._addresses[1]
+
+    @property
+    def reply_address(self):
+        return self._addresses[2]
+
+    @property
+    def round_trip(self):
+        # None if unknown
+        return self._round_trip
+
+    def update_round_trip(self, round_trip):
+        if ((round_trip is not None) and
+                ((self._round_trip is None) or
+                    (round_trip < self._round_trip))):
+            self._round_trip = round_trip
+
+    def __str__(self):
+        if (self._round_trip is None):
+            round_trip = "?"
+        else:
+            round_trip = "{0:.2f} ms".format(self._round_trip * 1000)
+        return "(server, sender = " + str(self._sender) + \
+            "; round trip = " + round_trip + ")"
+
+
+def rank_candidates(candidates):
+    # fastest first, servers without a measure last
+    return sorted(
+        candidates,
+        key=lambda candidate: (
+            candidate.round_trip is None, candidate.round_trip))
+
+
+def choose_fastest(candidates):
+    return candidates[0]
+
+
+def measure_round_trip(sender, addresses, timeout):
+    # sends one unicast probe to the discovery port of sender, from a socket
+    # of its own so that late replies to the broadcast or to the previous
+    # probes (which go to other sockets) cannot be taken for the answer
+    probe_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        started = monotonic()
+        probe_socket.sendto("1".encode("ascii"), sender)
+        deadline = started + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if (remaining <= 0):
+                return None
+            probe_socket.settimeout(remaining)
+            try:
+                data, address = probe_socket.recvfrom(512)
+            except socket.timeout:
+                return None
+            if (address != sender):
+                continue
+            try:
+                if (decode_data(data, address) != addresses):
+                    continue
+            except DecodingError:
+                continue
+            return monotonic() - started
+    finally:
+        probe_socket.close()
+
+
 class Broadcast(object):
     def __init__(self, port=9080, retries=5, timeout=10):
         ip_mask_all = '255'
@@ -27,7 +191,7 @@ class Broadcast(object):
         broadcast = get_network_ip().split('.')
         broadcast = '.'.join(broadcast[:-1] + [ip_mask_all])
         self._group = (broadcast, port)
-        print('group = ' + str(self._group))
+        LOGGER.debug("group = " + str(self._group))
         self._received = False
         self._data = None
         self._sender = None
@@ -36,69 +200,33 @@ class Broadcast(object):
 
     def send_all_broadcast_messages(self):
         tries = 0
-        while ((tries < self._retries) and (not self._received)):
-            self.send_one_broadcast_message()
-            tries += 1
+        try:
+            while ((tries < self._retries) and (not self._received)):
+                self.send_one_broadcast_message()
+                tries += 1
+        finally:
+            # only close once all the retries are done
+            self._socket.close()
         if (self._received):
             self.decode_data()
 
     def send_one_broadcast_message(self):
-        try:
-            print("before sendto")
-            sent = self._socket.sendto(
-                    "1".encode("ascii"), self._group)
-            print("after sendto ; " + repr(sent))
-            while not self._received:
-                try:
-                    self._data, self._sender = self._socket.recvfrom(
-                            self._size)
-                    self._received = True
-                except socket.timeout:
-                    print('timed out, no more responses', file=sys.stderr)
-                    break
-                else:
-                    print(
-                        'received "%s" from %s'
-                        % (repr(self._data), self._sender),
-                        file=sys.stderr)
-        finally:
-            print('closing socket', file=sys.stderr)
-            self._socket.close()
+        self._socket.sendto("1".encode("ascii"), self._group)
+        while not self._received:
+            try:
+                self._data, self._sender = self._socket.recvfrom(
+                        self._size)
+                self._received = True
+            except socket.timeout:
+                LOGGER.debug("timed out, no more responses")
+                break
+            else:
+                LOGGER.debug(
+                    "received %r from %s", self._data, self._sender)
 
     def decode_data(self):
-        # data (split on multiple lines for clarity):
-        # 0xA0
-        # size on 8 bytes
-        # Address of puller
-        # 0xA1
-        # size on 8 bytes
-        # Address of publisher
-        # 0x00
-        import struct
-        to_char = lambda x: struct.unpack('B', x)[0]
-        to_str = lambda x: x.decode("ascii")
-        assert(self._data[0] == '\xa0')
-        puller_size = to_char(self._data[1])
-        # print("puller_size = " + str(puller_size))
-        end_puller = 2 + puller_size
-        puller_address = to_str(self._data[2:end_puller])
-        # print("puller_address = " + puller_address)
-        assert(self._data[end_puller] == '\xa1')
-        publisher_size = to_char(self._data[end_puller + 1])
-        # print("publisher_size = " + str(publisher_size))
-        end_publisher = end_puller + 2 + publisher_size
-        publisher_address = to_str(self._data[end_puller + 2:end_publisher])
-        # print("publisher_address = " + publisher_address)
-        assert(self._data[end_publisher] == '\xa2')
-        replier_size = to_char(self._data[end_publisher + 1])
-        # print("replier_size = " + str(replier_size))
-        end_replier = end_publisher + 2 + replier_size
-        replier_address = to_str(self._data[end_publisher + 2:end_replier])
-        # print("replier_address = " + replier_address)
-        sender_ip, _ = self._sender
-        self._push_address = puller_address.replace('*', sender_ip)
-        self._subscribe_address = publisher_address.replace('*', sender_ip)
-        self._reply_address = replier_address.replace('*', sender_ip)
+        self._push_address, self._subscribe_address, self._reply_address = \
+            decode_data(self._data, self._sender)
         self._decding_successful = True
 
     @property
@@ -112,3 +240,228 @@ class Broadcast(object):
     @property
     def reply_address(self):
         return self._reply_address
+
+
+class DiscoveryError(Exception):
+    pass
+
+
+# Non blocking version of Broadcast: probes are sent on every IPv4 interface
+# from a background thread, waiting longer and longer between them, until a
+# server answers or the timeout expires. Callers either block on result() or
+# register callbacks called (from the discovery thread) once it is done.
+# With a window, every server answering within window seconds of the first
+# one is kept, the round trip to each of them is measured and chooser picks
+# one of them from the list ranked by round trip.
+class Discovery(object):
+    def __init__(
+            self,
+            port=9080,
+            timeout=60.0,
+            initial_delay=0.25,
+            max_delay=5.0,
+            callback=None,
+            window=None,
+            round_trip_probes=3,
+            round_trip_timeout=0.5,
+            chooser=choose_fastest):
+        self._port = port
+        self._window = window
+        self._round_trip_probes = round_trip_probes
+        self._round_trip_timeout = round_trip_timeout
+        self._chooser = chooser
+        self._candidates = []
+        self._timeout = timeout
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._size = 512
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        if (callback is not None):
+            self._callbacks.append(callback)
+        self._thread = None
+        self._addresses = None
+        self._sender = None
+        self._error = None
+        self._probes = 0
+
+    def start(self):
+        if (self._thread is None):
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def add_done_callback(self, callback):
+        with self._lock:
+            if (not self._done.is_set()):
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def result(self, timeout=None):
+        if (not self._done.wait(timeout)):
+            raise DiscoveryError("discovery still running")
+        if (self._error is not None):
+            raise self._error
+        return self._addresses
+
+    @property
+    def sender(self):
+        return self._sender
+
+    @property
+    def candidates(self):
+        # ranked by round trip, only filled when a window is given
+        return list(self._candidates)
+
+    @property
+    def probes(self):
+        return self._probes
+
+    @property
+    def push_address(self):
+        return self.result()[0]
+
+    @property
+    def subscribe_address(self):
+        return self.result()[1]
+
+    @property
+    def reply_address(self):
+        return self.result()[2]
+
+    def _run(self):
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            # replies are accepted from any interface
+            udp_socket.bind(('', 0))
+            groups = [
+                (address, self._port) for address in get_broadcast_addresses()]
+            LOGGER.debug("discovery groups = " + str(groups))
+            deadline = monotonic() + self._timeout
+            delay = self._initial_delay
+            while ((not self._cancelled.is_set()) and
+                    (monotonic() < deadline)):
+                sent = monotonic()
+                self._send_probes(udp_socket, groups)
+                if (self._wait_for_reply(
+                        udp_socket,
+                        min(deadline, monotonic() + delay),
+                        sent)):
+                    return
+                delay = min(delay * 2, self._max_delay)
+            self._finish(None, DiscoveryError("no server found"))
+        except Exception as error:
+            self._finish(None, error)
+        finally:
+            udp_socket.close()
+
+    def _send_probes(self, udp_socket, groups):
+        for group in groups:
+            try:
+                udp_socket.sendto("1".encode("ascii"), group)
+                self._probes += 1
+            except socket.error as error:
+                LOGGER.debug("probe to " + str(group) + " failed: " +
+                             str(error))
+
+    def _wait_for_reply(self, udp_socket, until, sent):
+        while (not self._cancelled.is_set()):
+            remaining = until - monotonic()
+            if (remaining <= 0):
+                return False
+            udp_socket.settimeout(remaining)
+            try:
+                data, sender = udp_socket.recvfrom(self._size)
+            except socket.timeout:
+                return False
+            try:
+                addresses = decode_data(data, sender)
+            except DecodingError as error:
+                LOGGER.debug(
+                    "ignore invalid reply from " + str(sender) + ": " +
+                    str(error))
+                continue
+            if (self._window is None):
+                self._sender = sender
+                self._finish(addresses, None)
+            else:
+                self._collect(udp_socket, sender, addresses, sent)
+            return True
+        return False
+
+    def _collect(self, udp_socket, first_sender, first_addresses, sent):
+        # the replies to the broadcast give a rough round trip (measured
+        # from the last probes sent), refined by the unicast probes
+        candidates = {
+            first_sender[0]: ServerCandidate(
+                first_sender, first_addresses, monotonic() - sent)}
+        until = monotonic() + self._window
+        while (not self._cancelled.is_set()):
+            remaining = until - monotonic()
+            if (remaining <= 0):
+                break
+            udp_socket.settimeout(remaining)
+            try:
+                data, sender = udp_socket.recvfrom(self._size)
+            except socket.timeout:
+                break
+            if (sender[0] in candidates):
+                continue
+            try:
+                addresses = decode_data(data, sender)
+            except DecodingError as error:
+                LOGGER.debug(
+                    "ignore invalid reply from " + str(sender) + ": " +
+                    str(error))
+                continue
+            candidates[sender[0]] = ServerCandidate(
+                sender, addresses, monotonic() - sent)
+        for candidate in candidates.values():
+            for _ in range(self._round_trip_probes):
+                candidate.update_round_trip(measure_round_trip(
+                    candidate.sender,
+                    candidate.addresses,
+                    self._round_trip_timeout))
+        self._candidates = rank_candidates(candidates.values())
+        LOGGER.info("servers found: " + ", ".join(
+            str(candidate) for candidate in self._candidates))
+        chosen = self._chooser(self._candidates)
+        self._sender = chosen.sender
+        self._finish(chosen.addresses, None)
+
+    def _finish(self, addresses, error):
+        with self._lock:
+            self._addresses = addresses
+            self._error = error
+            self._done.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+
+def discover_servers(port=9080, window=1.0, timeout=10.0):
+    # blocking helper returning every server found, fastest first
+    discovery = Discovery(port=port, timeout=timeout, window=window)
+    try:
+        discovery.start().result()
+    except DiscoveryError:
+        return []
+    return discovery.candidates
+
+
+def configure_logging(verbose):
+    global LOGGER
+    # records are formatted and written by the logging thread
+    LOGGER = async_logging.configure(__name__, verbose)
@@ -0,0 +1,205 @@
+from __future__ import print_function
+import argparse
+import itertools
+import logging
+import mmap
+import struct
+import time
+
+import zmq
+
+from orwell.client import async_logging
+from orwell.client.clock import monotonic
+from orwell.client.clock import process_time
+from orwell.client import framing
+from orwell.client import handshake
+from orwell.client import runner as runner_module
+
+MAGIC = b"ORWCAP"
+VERSION = 1
+HEADER = struct.Struct("<6sB")
+# receive time (seconds since the first message) and number of frames
+MESSAGE_HEADER = struct.Struct("<dH")
+FRAME_HEADER = struct.Struct("<I")
+# inproc endpoints need a different name for each replay
+ENDPOINT_IDS = itertools.count()
+
+
+def _to_bytes(frame):
+    if (hasattr(frame, "bytes")):
+        # zmq.Frame received with copy=False
+        return frame.bytes
+    return memoryview(frame).tobytes()
+
+
+# Streams the raw frames of every message received to a file, each message
+# prefixed with its receive time and each frame with its length.
+class CaptureWriter(object):
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION))
+        self._started = None
+        self._count = 0
+
+    @property
+    def count(self):
+        return self._count
+
+    def write(self, frames, timestamp=None):
+        if (timestamp is None):
+            timestamp = monotonic()
+        if (self._started is None):
+            self._started = timestamp
+        parts = [MESSAGE_HEADER.pack(timestamp - self._started, len(frames))]
+        for frame in frames:
+            data = _to_bytes(frame)
+            parts.append(FRAME_HEADER.pack(len(data)))
+            parts.append(data)
+        self._file.write(b"".join(parts))
+        self._count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Reads a capture through a memory map: the frames are views of the map and
+# are only valid until close().
+class CaptureReader(object):
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._view = memoryview(self._map)
+        except TypeError:
+            # no buffer interface (python 2): slicing the map copies
+            self._view = self._map
+        magic, version = HEADER.unpack_from(self._map, 0)
+        if ((MAGIC != magic) or (VERSION != version)):
+            self.close()
+            raise ValueError(path + " is not a capture")
+
+    def __iter__(self):
+        # (offset, frames) for each message
+        data = self._map
+        view = self._view
+        size = len(data)
+        position = HEADER.size
+        while (position < size):
+            if (position + MESSAGE_HEADER.size > size):
+                raise ValueError("capture truncated at " + str(position))
+            offset, count = MESSAGE_HEADER.unpack_from(data, position)
+            position += MESSAGE_HEADER.size
+            frames = []
+            for _ in range(count):
+                length, = FRAME_HEADER.unpack_from(data, position)
+                position += FRAME_HEADER.size
+                if (position + length > size):
+                    raise ValueError("capture truncated at " + str(position))
+                frames.append(view[position:position + length])
+                position += length
+            yield offset, frames
+
+    def close(self):
+        try:
+            if (hasattr(self._view, "release")):
+                self._view.release()
+            self._map.close()
+        except BufferError:
+            # some frames are still referenced, the map is unmapped when
+            # they are garbage collected
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def build_replay_runner(context, instrument=True):
+    # the runner is connected to endpoints nobody binds: the messages only
+    # come from the capture
+    suffix = str(next(ENDPOINT_IDS))
+    runner = runner_module.Runner(
+        [],
+        push_address="inproc://capture-push-" + suffix,
+        subscribe_address="inproc://capture-subscribe-" + suffix,
+        reply_address="inproc://capture-reply-" + suffix,
+        instrument=instrument,
+        context=context)
+    # GameState messages are decoded as if the client was waiting for the
+    # game to start, the game starting with the first one that says so
+    runner.state = runner_module.Runner.STATE_WAITING_GAME_START
+    return runner
+
+
+# Pushes the messages of a capture through MessageWrapper and the dispatch of
+# a Runner, as fast as possible or with the recorded timing.
+def replay(reader, runner, realtime=False):
+    started = None
+    count = 0
+    wall_start = monotonic()
+    cpu_start = process_time()
+    for offset, frames in reader:
+        if (realtime):
+            now = monotonic()
+            if (started is None):
+                started = now - offset
+            delay = started + offset - now
+            if (delay > 0):
+                time.sleep(delay)
+        message_wrapper = framing.unwrap(frames)
+        if (message_wrapper is not None):
+            runner.replay(message_wrapper)
+        count += 1
+    return count, monotonic() - wall_start, process_time() - cpu_start
+
+
+def parse():
+    parser = argparse.ArgumentParser(
+        description='Replay a capture of the SUB stream through the client.')
+    parser.add_argument('capture', help='File written with --capture')
+    parser.add_argument(
+        '--realtime',
+        help='Follow the recorded timing instead of going as fast as possible',
+        default=False,
+        action="store_true")
+    parser.add_argument(
+        '--verbose', '-v',
+        help='Verbose mode',
+        default=False,
+        action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse()
+    runner_module.configure_logging(arguments.verbose)
+    handshake.configure_logging(arguments.verbose)
+    if (not arguments.verbose):
+        logging.getLogger(runner_module.__name__).setLevel(logging.WARNING)
+    context = zmq.Context()
+    runner = build_replay_runner(context)
+    with CaptureReader(arguments.capture) as reader:
+        count, wall_time, cpu_time = replay(reader, runner, arguments.realtime)
+    print("messages: " + str(count))
+    print("wall time: {0:.3f} s; cpu time: {1:.3f} s".format(
+        wall_time, cpu_time))
+    if (count):
+        print("cpu per message: {0:.2f} us".format(cpu_time / count * 1e6))
+    print(str(runner.instrumentation))
+    print(str(runner.game_state_store.snapshot))
+    runner.destroy()
+    context.term()
+    async_logging.shutdown()
+
+
+if ("__main__" == __name__):
+    main()
@@ -0,0 +1,37 @@
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    # python 2.7 has no monotonic clock in the standard library
+    monotonic = time.time
+
+try:
+    process_time = time.process_time
+except AttributeError:
+    # on linux time.clock measures the processor time of the process
+    process_time = time.clock
+
+
+def _rusage_thread_time():
+    usage = resource.getrusage(_RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+
+try:
+    thread_time = time.thread_time
+except AttributeError:
+    # processor time of the calling thread only, not available in python 2.7
+    # where linux still gives it with getrusage (RUSAGE_THREAD is 1 there)
+    if ((resource is not None) and (sys.platform.startswith("linux"))):
+        _RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", 1)
+        thread_time = _rusage_thread_time
+    else:
+        thread_time = None
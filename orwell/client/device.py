@@ -19,3 +19,15 @@ class Device(object):
     # @abs.abstractmethod
     def read_ping(self):
         pass
+
+    @property
+    def poll_sources(self):
+        # sockets or file descriptors that become readable when the device
+        # has something new to process
+        return []
+
+    @property
+    def poll_interval(self):
+        # maximum time (in seconds) the event loop may wait before calling
+        # process() again ; None if the device only relies on poll_sources
+        return None
@@ -0,0 +1,78 @@
+import json
+import os
+import time
+
+from orwell.client import async_logging
+
+LOGGER = None
+
+
+def get_default_path():
+    cache_home = os.environ.get(
+        "XDG_CACHE_HOME",
+        os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "orwell", "discovery.json")
+
+
+# Remembers the addresses found by the broadcast discovery so that the next
+# start can try them before broadcasting again.
+class DiscoveryCache(object):
+    def __init__(self, path=None, ttl=24 * 3600):
+        if (path is None):
+            path = get_default_path()
+        self._path = path
+        self._ttl = ttl
+
+    @property
+    def path(self):
+        return self._path
+
+    def load(self):
+        try:
+            with open(self._path) as cache_file:
+                content = json.load(cache_file)
+            # wall clock time as the cache outlives the process
+            age = time.time() - content["timestamp"]
+            if ((age < 0) or (age > self._ttl)):
+                LOGGER.debug("discovery cache expired")
+                return None
+            return (
+                str(content["push_address"]),
+                str(content["subscribe_address"]),
+                str(content["reply_address"]))
+        except (IOError, OSError, ValueError, KeyError, TypeError) as error:
+            LOGGER.debug("no usable discovery cache: " + str(error))
+            return None
+
+    def save(self, addresses):
+        push_address, subscribe_address, reply_address = addresses
+        directory = os.path.dirname(self._path)
+        temporary_path = self._path + ".tmp"
+        try:
+            if (not os.path.isdir(directory)):
+                os.makedirs(directory)
+            with open(temporary_path, "w") as cache_file:
+                json.dump(
+                    {
+                        "push_address": push_address,
+                        "subscribe_address": subscribe_address,
+                        "reply_address": reply_address,
+                        "timestamp": time.time(),
+                    },
+                    cache_file)
+            # readers never see a partially written file
+            os.rename(temporary_path, self._path)
+        except (IOError, OSError) as error:
+            LOGGER.warning("could not save discovery cache: " + str(error))
+
+    def clear(self):
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+
+def configure_logging(verbose):
+    global LOGGER
+    # records are formatted and written by the logging thread
+    LOGGER = async_logging.configure(__name__, verbose)
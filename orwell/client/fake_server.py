@@ -0,0 +1,338 @@
+from __future__ import print_function
+import argparse
+import itertools
+import socket
+import struct
+import threading
+import time
+
+import zmq
+
+import orwell.messages.controller_pb2 as pb_controller
+import orwell.messages.robot_pb2 as pb_robot
+import orwell.messages.server_game_pb2 as pb_server_game
+
+from orwell.client import async_logging
+from orwell.client.clock import monotonic
+from orwell.client.message_wrapper import MessageWrapper
+
+NAME = "fake_server"
+ALL_CLIENTS = "all_clients"
+# prefix of the winner field carrying the publication time when GameState
+# messages are stamped (the clients do not look at the winner)
+STAMP_PREFIX = "@"
+LOGGER = None
+
+
+def build_discovery_reply(push_address, subscribe_address, reply_address):
+    # same format as the one decoded by Broadcast.decode_data ; a '*' in an
+    # address is replaced by the client with the ip of the sender
+    data = b""
+    for tag, address in (
+            (0xa0, push_address),
+            (0xa1, subscribe_address),
+            (0xa2, reply_address)):
+        address = address.encode("ascii")
+        data += struct.pack("BB", tag, len(address)) + address
+    return data + b"\x00"
+
+
+def _unwrap(frames):
+    if (1 == len(frames)):
+        return MessageWrapper(frames[0]), False
+    return MessageWrapper.from_frames(*frames), True
+
+
+# Stand-in for the game server, good enough to run clients without network:
+# answers the UDP discovery datagram, Hello with Welcome, Ping with Pong and
+# publishes GameState at a configurable rate and size. Replies use the same
+# wire format (space delimited or multipart) as the message they answer.
+class FakeServer(object):
+    def __init__(
+            self,
+            push_address="tcp://*:9000",
+            subscribe_address="tcp://*:9001",
+            reply_address="tcp://*:9004",
+            discovery_port=9080,
+            game_state_rate=1.0,
+            game_state_size=0,
+            playing=True,
+            seconds=600,
+            context=None,
+            record_inputs=False,
+            stamp_game_states=False):
+        self.push_address = push_address
+        self.subscribe_address = subscribe_address
+        self.reply_address = reply_address
+        self._discovery_port = discovery_port
+        if (game_state_rate):
+            self._game_state_period = 1.0 / game_state_rate
+        else:
+            self._game_state_period = None
+        self._game_state_size = game_state_size
+        self._playing = playing
+        self._seconds = seconds
+        if (context is None):
+            context = zmq.Context.instance()
+        self._context = context
+        self._record_inputs = record_inputs
+        self._stamp_game_states = stamp_game_states
+        self._client_ids = itertools.count(1)
+        self._clients = set()
+        self._multipart = False
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.received = []
+        self.hellos = 0
+        self.inputs = 0
+        self.pings = 0
+        self.game_states = 0
+        self.discoveries = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        self._stop.set()
+        if (self._thread):
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        pull = self._context.socket(zmq.PULL)
+        pull.setsockopt(zmq.LINGER, 0)
+        pull.bind(self.push_address)
+        publisher = self._context.socket(zmq.PUB)
+        publisher.setsockopt(zmq.LINGER, 0)
+        publisher.bind(self.subscribe_address)
+        replier = self._context.socket(zmq.REP)
+        replier.setsockopt(zmq.LINGER, 0)
+        replier.bind(self.reply_address)
+        poller = zmq.Poller()
+        poller.register(pull, zmq.POLLIN)
+        poller.register(replier, zmq.POLLIN)
+        discovery = None
+        if (self._discovery_port is not None):
+            discovery = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            discovery.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            discovery.bind(("", self._discovery_port))
+            # the poller reports plain sockets by file descriptor
+            poller.register(discovery.fileno(), zmq.POLLIN)
+        self._ready.set()
+        started = monotonic()
+        next_game_state = started
+        try:
+            while not self._stop.is_set():
+                timeout = 100
+                if (self._game_state_period is not None):
+                    timeout = max(
+                        0, min(timeout, (next_game_state - monotonic()) * 1000))
+                events = dict(poller.poll(timeout))
+                if ((discovery is not None) and
+                        (discovery.fileno() in events)):
+                    self._answer_discovery(discovery)
+                if (replier in events):
+                    self._answer_hello(replier)
+                if (pull in events):
+                    self._read_pushed(pull, publisher)
+                now = monotonic()
+                if ((self._game_state_period is not None) and
+                        (now >= next_game_state)):
+                    self._publish_game_state(
+                        publisher, ALL_CLIENTS, int(now - started))
+                    next_game_state = now + self._game_state_period
+        finally:
+            for zmq_socket in (pull, publisher, replier):
+                zmq_socket.close(0)
+            if (discovery is not None):
+                discovery.close()
+
+    def _send(self, zmq_socket, routing_id, message_type, payload, multipart):
+        if (multipart):
+            zmq_socket.send_multipart([routing_id, message_type, payload])
+        else:
+            zmq_socket.send(routing_id + " " + message_type + " " + payload)
+
+    def _answer_discovery(self, discovery):
+        _, sender = discovery.recvfrom(512)
+        self.discoveries += 1
+        LOGGER.debug("discovery from " + str(sender))
+        discovery.sendto(
+            build_discovery_reply(
+                self.push_address,
+                self.subscribe_address,
+                self.reply_address),
+            sender)
+
+    def _build_game_state(self, elapsed):
+        game_state = pb_server_game.GameState()
+        game_state.playing = self._playing
+        game_state.seconds = max(0, self._seconds - elapsed)
+        for index in range(2):
+            team = game_state.teams.add()
+            team.name = "team_" + str(index)
+            team.num_players = 1
+            team.score = 0
+        if (self._stamp_game_states):
+            # monotonic clocks are shared by all the processes of the host so
+            # clients can compute how long the message took to reach them
+            game_state.winner = STAMP_PREFIX + repr(monotonic())
+        missing = self._game_state_size - game_state.ByteSize()
+        if (missing > 0):
+            # the extra team only exists to reach the requested size
+            team = game_state.teams.add()
+            team.name = "~" * missing
+            team.num_players = 0
+            team.score = 0
+        return game_state
+
+    def _publish_game_state(self, publisher, routing_id, elapsed):
+        payload = self._build_game_state(elapsed).SerializeToString()
+        self._send(
+            publisher, routing_id, "GameState", payload, self._multipart)
+        self.game_states += 1
+
+    def _answer_hello(self, replier):
+        message_wrapper, multipart = _unwrap(replier.recv_multipart())
+        self._multipart = multipart
+        self.hellos += 1
+        hello = pb_controller.Hello()
+        hello.ParseFromString(message_wrapper.payload)
+        client_id = message_wrapper.recipient
+        if (client_id not in self._clients):
+            # first Hello, sent with a temporary routing id
+            client_id = "client_" + str(next(self._client_ids))
+            self._clients.add(client_id)
+        LOGGER.info(
+            "Hello from '" + hello.name + "' (ready=" + str(hello.ready) +
+            ") -> " + client_id)
+        welcome = pb_server_game.Welcome()
+        welcome.id = client_id
+        welcome.robot = "robot_" + client_id
+        welcome.team = "team_0"
+        welcome.game_state.CopyFrom(self._build_game_state(0))
+        self._send(
+            replier,
+            message_wrapper.recipient,
+            "Welcome",
+            welcome.SerializeToString(),
+            multipart)
+
+    def _read_pushed(self, pull, publisher):
+        while True:
+            try:
+                frames = pull.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            if (self._record_inputs):
+                self.received.append((monotonic(), frames))
+            message_wrapper, multipart = _unwrap(frames)
+            if ("Input" == message_wrapper.message_type):
+                self.inputs += 1
+            elif ("Ping" == message_wrapper.message_type):
+                self.pings += 1
+                self._answer_ping(
+                    publisher, message_wrapper, multipart)
+
+    def _answer_ping(self, publisher, message_wrapper, multipart):
+        received = monotonic()
+        ping = pb_controller.Ping()
+        ping.ParseFromString(message_wrapper.payload)
+        pong = pb_robot.Pong()
+        for timing in ping.timing:
+            copy = pong.timing.add()
+            copy.logger = timing.logger
+            copy.timestamp = timing.timestamp
+            copy.elapsed = timing.elapsed
+        own = pong.timing.add()
+        own.logger = NAME
+        own.timestamp = ping.timing[0].timestamp if ping.timing else 0
+        own.elapsed = int(round((monotonic() - received) * 1000))
+        self._send(
+            publisher,
+            message_wrapper.recipient,
+            "Pong",
+            pong.SerializeToString(),
+            multipart)
+
+    def __str__(self):
+        return "(fake server, discoveries = " + str(self.discoveries) + \
+            "; hellos = " + str(self.hellos) + \
+            "; inputs = " + str(self.inputs) + \
+            "; pings = " + str(self.pings) + \
+            "; game states = " + str(self.game_states) + ")"
+
+
+def parse():
+    parser = argparse.ArgumentParser(description='Fake game server.')
+    parser.add_argument(
+        '--push-port', help='Port of the PULL socket', type=int, default=9000)
+    parser.add_argument(
+        '--subscribe-port',
+        help='Port of the PUB socket',
+        type=int,
+        default=9001)
+    parser.add_argument(
+        '--reply-port', help='Port of the REP socket', type=int, default=9004)
+    parser.add_argument(
+        '--discovery-port',
+        help='UDP port answering discovery datagrams',
+        type=int,
+        default=9080)
+    parser.add_argument(
+        '--rate',
+        help='GameState messages published per second',
+        type=float,
+        default=1.0)
+    parser.add_argument(
+        '--size',
+        help='Minimum size in bytes of the GameState payload',
+        type=int,
+        default=0)
+    parser.add_argument(
+        '--not-playing',
+        help='Report that the game is not started',
+        dest='playing',
+        default=True,
+        action="store_false")
+    parser.add_argument(
+        '--verbose', '-v',
+        help='Verbose mode',
+        default=False,
+        action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse()
+    configure_logging(arguments.verbose)
+    server = FakeServer(
+        push_address="tcp://*:" + str(arguments.push_port),
+        subscribe_address="tcp://*:" + str(arguments.subscribe_port),
+        reply_address="tcp://*:" + str(arguments.reply_port),
+        discovery_port=arguments.discovery_port,
+        game_state_rate=arguments.rate,
+        game_state_size=arguments.size,
+        playing=arguments.playing)
+    server.start()
+    try:
+        while True:
+            time.sleep(10)
+            LOGGER.info(str(server))
+    except KeyboardInterrupt:
+        server.stop()
+    async_logging.shutdown()
+
+
+def configure_logging(verbose):
+    global LOGGER
+    # records are formatted and written by the logging thread
+    LOGGER = async_logging.configure(__name__, verbose)
+
+
+if ("__main__" == __name__):
+    main()
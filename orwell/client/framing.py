@@ -0,0 +1,64 @@
+from orwell.client.message_wrapper import MessageWrapper
+
+# routing id, message type and payload in one frame separated by spaces
+SPACE_DELIMITED = "space"
+# routing id, message type and payload in three frames
+MULTIPART = "multipart"
+# send space delimited messages and switch to multipart if the server
+# answers the first Hello with a multipart message
+AUTO = "auto"
+WIRE_FORMATS = (SPACE_DELIMITED, MULTIPART, AUTO)
+
+
+class SpaceDelimitedFraming(object):
+    name = SPACE_DELIMITED
+
+    def frame(self, routing_id, message_type, payload):
+        return routing_id + " " + message_type + " " + payload
+
+    def send_framed(self, socket, framed, flags=0):
+        socket.send(framed, flags)
+
+    def send(self, socket, routing_id, message_type, payload, flags=0):
+        self.send_framed(
+            socket, self.frame(routing_id, message_type, payload), flags)
+
+
+class MultipartFraming(object):
+    name = MULTIPART
+
+    def frame(self, routing_id, message_type, payload):
+        return [routing_id, message_type, payload]
+
+    def send_framed(self, socket, framed, flags=0):
+        socket.send_multipart(framed, flags, copy=False)
+
+    def send(self, socket, routing_id, message_type, payload, flags=0):
+        self.send_framed(
+            socket, self.frame(routing_id, message_type, payload), flags)
+
+
+def build_framing(wire_format):
+    if (MULTIPART == wire_format):
+        return MultipartFraming()
+    else:
+        assert(wire_format in WIRE_FORMATS)
+        return SpaceDelimitedFraming()
+
+
+def receive(socket, flags=0):
+    # both formats are accepted whatever the format used to send
+    return unwrap(socket.recv_multipart(flags, copy=False))
+
+
+def unwrap(frames):
+    # frames can be zmq.Frame objects, bytes or memoryviews
+    if (1 == len(frames)):
+        if (not len(frames[0])):
+            return None
+        return MessageWrapper(frames[0])
+    elif (3 == len(frames)):
+        return MessageWrapper.from_frames(*frames)
+    else:
+        raise ValueError(
+            "Unexpected number of frames: " + str(len(frames)))
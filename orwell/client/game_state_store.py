@@ -0,0 +1,123 @@
+PLAYING = "playing"
+SECONDS = "seconds"
+SCORES = "scores"
+TEAMS = "teams"
+FIELDS = (PLAYING, SECONDS, SCORES, TEAMS)
+
+
+class GameStateSnapshot(object):
+    def __init__(self, game_state):
+        self._playing = game_state.playing
+        self._seconds = game_state.seconds
+        self._scores = {}
+        self._num_players = {}
+        for team in game_state.teams:
+            self._scores[team.name] = team.score
+            self._num_players[team.name] = team.num_players
+
+    @property
+    def playing(self):
+        return self._playing
+
+    @property
+    def seconds(self):
+        return self._seconds
+
+    @property
+    def scores(self):
+        return self._scores
+
+    @property
+    def num_players(self):
+        return self._num_players
+
+    def __str__(self):
+        teams = ", ".join(
+            name + " (players = " + str(self._num_players[name]) +
+            ", score = " + str(self._scores[name]) + ")"
+            for name in sorted(self._scores))
+        return "(game state, playing = " + str(self._playing) + \
+            "; seconds = " + str(self._seconds) + \
+            "; teams = " + teams + ")"
+
+
+def _changed_values(previous, current):
+    # teams that disappeared are reported with a None value
+    changed = {}
+    for name, value in current.items():
+        if ((name not in previous) or (previous[name] != value)):
+            changed[name] = value
+    for name in previous:
+        if (name not in current):
+            changed[name] = None
+    return changed
+
+
+class GameStateDiff(object):
+    def __init__(self, previous, current):
+        self._changes = {}
+        if ((previous is None) or (previous.playing != current.playing)):
+            self._changes[PLAYING] = current.playing
+        if ((previous is None) or (previous.seconds != current.seconds)):
+            self._changes[SECONDS] = current.seconds
+        if (previous is None):
+            scores = dict(current.scores)
+            teams = dict(current.num_players)
+        else:
+            scores = _changed_values(previous.scores, current.scores)
+            teams = _changed_values(previous.num_players, current.num_players)
+        if (scores):
+            self._changes[SCORES] = scores
+        if (teams):
+            self._changes[TEAMS] = teams
+
+    def __contains__(self, field):
+        return field in self._changes
+
+    def __len__(self):
+        return len(self._changes)
+
+    def get(self, field, default=None):
+        return self._changes.get(field, default)
+
+    @property
+    def fields(self):
+        return [field for field in FIELDS if field in self._changes]
+
+    def __str__(self):
+        return "(game state diff, " + "; ".join(
+            field + " = " + str(self._changes[field])
+            for field in self.fields) + ")"
+
+
+# Keeps the last GameState received and only notifies the subscribers of
+# the fields that changed since the previous one.
+class GameStateStore(object):
+    def __init__(self):
+        self._snapshot = None
+        self._subscribers = dict((field, []) for field in FIELDS)
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def subscribe(self, field, callback):
+        # callback(value, snapshot) ; for SCORES and TEAMS value only holds
+        # the teams that changed
+        self._subscribers[field].append(callback)
+
+    def unsubscribe(self, field, callback):
+        self._subscribers[field].remove(callback)
+
+    def update(self, game_state):
+        snapshot = GameStateSnapshot(game_state)
+        diff = GameStateDiff(self._snapshot, snapshot)
+        self._snapshot = snapshot
+        for field in diff.fields:
+            value = diff.get(field)
+            for callback in self._subscribers[field]:
+                callback(value, snapshot)
+        return diff
+
+    def clear(self):
+        self._snapshot = None
@@ -0,0 +1,184 @@
+import zmq
+
+from orwell.client import async_logging
+from orwell.client.clock import monotonic
+from orwell.client import framing
+from orwell.client.latency import Histogram
+
+LOGGER = None
+
+IDLE = "idle"
+WAITING = "waiting"
+DONE = "done"
+FAILED = "failed"
+
+
+class HandshakeError(Exception):
+    pass
+
+
+# Hello / Welcome exchange over a REQ socket that never blocks (lazy pirate):
+# the caller polls socket and calls receive() when it is readable and tick()
+# when next_deadline is reached. A REQ socket that lost its reply can not
+# send anything else so it is closed and replaced before each new attempt.
+class Handshake(object):
+    def __init__(self, context, timeout=2.5, retries=3):
+        self._context = context
+        self._timeout = timeout
+        self._retries = retries
+        self._address = None
+        self._socket = None
+        self._state = IDLE
+        self._request = None
+        self._attempt_timeout = timeout
+        self._retries_left = 0
+        self._sent_at = None
+        self._started = None
+        self._attempts = 0
+        self._failures = 0
+        self._latency = Histogram()
+        self._build_socket()
+
+    @property
+    def socket(self):
+        # changes every time an attempt fails
+        return self._socket
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def waiting(self):
+        return (WAITING == self._state)
+
+    @property
+    def failed(self):
+        return (FAILED == self._state)
+
+    @property
+    def next_deadline(self):
+        if (WAITING != self._state):
+            return None
+        return self._sent_at + self._attempt_timeout
+
+    @property
+    def attempts(self):
+        return self._attempts
+
+    @property
+    def failures(self):
+        return self._failures
+
+    @property
+    def latency(self):
+        # from the first attempt to the reply, for every handshake done
+        return self._latency
+
+    def connect(self, address):
+        if (WAITING == self._state):
+            # the pending request would never be answered on the new address
+            self._rebuild_socket()
+        elif (self._address is not None):
+            self._socket.disconnect(self._address)
+        self._address = address
+        self._socket.connect(address)
+
+    def close(self):
+        self._socket.close(0)
+
+    def request(
+            self,
+            framing_,
+            routing_id,
+            payload,
+            timeout=None,
+            retries=None,
+            now=None):
+        assert(WAITING != self._state)
+        if (now is None):
+            now = monotonic()
+        if (timeout is None):
+            timeout = self._timeout
+        if (retries is None):
+            retries = self._retries
+        self._request = (framing_, routing_id, payload)
+        self._attempt_timeout = timeout
+        self._retries_left = retries
+        self._started = now
+        self._state = WAITING
+        self._send(now)
+
+    def receive(self, now=None):
+        # returns the reply or None if there is nothing to read yet
+        if (WAITING != self._state):
+            return None
+        try:
+            message_wrapper = framing.receive(self._socket, zmq.NOBLOCK)
+        except zmq.Again:
+            return None
+        except ValueError as error:
+            LOGGER.warning(
+                "invalid reply from " + str(self._address) + ": " +
+                str(error))
+            message_wrapper = None
+        if (now is None):
+            now = monotonic()
+        if (message_wrapper is None):
+            # an empty or invalid reply counts as a failed attempt
+            self._retry(now, "no valid reply from ")
+            return None
+        self._latency.record(now - self._started)
+        self._state = DONE
+        return message_wrapper
+
+    def tick(self, now=None):
+        if (WAITING != self._state):
+            return
+        if (now is None):
+            now = monotonic()
+        if (now < self.next_deadline):
+            return
+        self._retry(now, "no reply from ")
+
+    def _retry(self, now, reason):
+        self._failures += 1
+        self._rebuild_socket()
+        if (self._retries_left <= 0):
+            LOGGER.warning(
+                reason + str(self._address) + " after " +
+                str(self._attempts) + " attempt(s)")
+            self._state = FAILED
+            return
+        self._retries_left -= 1
+        LOGGER.info(
+            reason + str(self._address) + ", retry (" +
+            str(self._retries_left) + " left)")
+        self._send(now)
+
+    def _send(self, now):
+        framing_, routing_id, payload = self._request
+        framing_.send(self._socket, routing_id, "Hello", payload)
+        self._sent_at = now
+        self._attempts += 1
+
+    def _build_socket(self):
+        self._socket = self._context.socket(zmq.REQ)
+        self._socket.setsockopt(zmq.LINGER, 0)
+
+    def _rebuild_socket(self):
+        self._socket.close(0)
+        self._build_socket()
+        if (self._address is not None):
+            self._socket.connect(self._address)
+
+    def __str__(self):
+        return "(handshake, attempts = " + str(self._attempts) + \
+            "; failures = " + str(self._failures) + \
+            "; latency = " + str(self._latency) + ")"
+
+
+def configure_logging(verbose):
+    global LOGGER
+    # records are formatted and written by the logging thread
+    LOGGER = async_logging.configure(__name__, verbose)
@@ -1,6 +1,3 @@
-import orwell.messages.controller_pb2 as pb_controller
-
-
 class Input(object):
     def __init__(
             self,
@@ -8,12 +5,111 @@ class Input(object):
             right,
             fire_weapon1,
             fire_weapon2):
-        pb_input = pb_controller.Input()
-        pb_input.move.left = left
-        pb_input.move.right = right
-        pb_input.fire.weapon1 = fire_weapon1
-        pb_input.fire.weapon2 = fire_weapon2
-        self._payload = pb_input.SerializeToString()
+        self._left = left
+        self._right = right
+        self._fire_weapon1 = fire_weapon1
+        self._fire_weapon2 = fire_weapon2
+        # only serialised when needed as the InputCache usually already
+        # holds the framed message
+        self._payload = None
+
+    @property
+    def left(self):
+        return self._left
+
+    @property
+    def right(self):
+        return self._right
+
+    @property
+    def fire_weapon1(self):
+        return self._fire_weapon1
+
+    @property
+    def fire_weapon2(self):
+        return self._fire_weapon2
+
+    @property
+    def payload(self):
+        if (self._payload is None):
+            # imported here to keep start up fast
+            import orwell.messages.controller_pb2 as pb_controller
+            pb_input = pb_controller.Input()
+            pb_input.move.left = self._left
+            pb_input.move.right = self._right
+            pb_input.fire.weapon1 = self._fire_weapon1
+            pb_input.fire.weapon2 = self._fire_weapon2
+            self._payload = pb_input.SerializeToString()
+        return self._payload
 
     def get_message(self, routing_id):
-        return routing_id + " Input " + self._payload
+        return routing_id + " Input " + self.payload
+
+
+# Devices quantize their values so only a finite number of different Input
+# messages exist. The framed messages are kept for the current routing id so
+# that sending an Input is a dictionary lookup. Messages are keyed on the exact
+# values: precision is only the grid used by prefill().
+class InputCache(object):
+    def __init__(self, framing, routing_id, precision=0.025, max_size=65536):
+        self._precision = float(precision)
+        self._max_size = max_size
+        self._hits = 0
+        self._misses = 0
+        self.reset(framing, routing_id)
+
+    def reset(self, framing, routing_id):
+        self._framing = framing
+        self._routing_id = routing_id
+        self._messages = {}
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def __len__(self):
+        return len(self._messages)
+
+    def get(self, input_):
+        key = (
+            input_.left,
+            input_.right,
+            bool(input_.fire_weapon1),
+            bool(input_.fire_weapon2))
+        framed = self._messages.get(key)
+        if (framed is None):
+            self._misses += 1
+            framed = self._framing.frame(
+                self._routing_id, "Input", input_.payload)
+            if (len(self._messages) < self._max_size):
+                self._messages[key] = framed
+        else:
+            self._hits += 1
+        return framed
+
+    def prefill(self):
+        steps = int(round(1 / self._precision))
+        for left in range(-steps, steps + 1):
+            for right in range(-steps, steps + 1):
+                for fire_weapon1 in (False, True):
+                    for fire_weapon2 in (False, True):
+                        if (len(self._messages) >= self._max_size):
+                            return
+                        # the values the devices produce for these steps
+                        key = (
+                            left * self._precision,
+                            right * self._precision,
+                            fire_weapon1,
+                            fire_weapon2)
+                        input_ = Input(*key)
+                        self._messages[key] = self._framing.frame(
+                            self._routing_id, "Input", input_.payload)
+
+    def __str__(self):
+        return "(input cache, size = " + str(len(self._messages)) + \
+            "; hits = " + str(self._hits) + \
+            "; misses = " + str(self._misses) + ")"
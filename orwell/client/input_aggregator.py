@@ -0,0 +1,108 @@
+from orwell.client.clock import monotonic
+from orwell.client.input import Input
+
+# the axes of the device with the highest priority that is not at rest win
+OVERRIDE = "override"
+# each axis takes the value furthest from 0 among the devices
+MAX_MAGNITUDE = "max_magnitude"
+AXIS_POLICIES = (OVERRIDE, MAX_MAGNITUDE)
+# a button is pressed if it is pressed on any device
+OR = "or"
+BUTTON_POLICIES = (OR, OVERRIDE)
+
+
+# Combines the last Input of every device into a single Input per tick so
+# that attaching more devices does not send more messages. Devices are
+# identified by their index, the lowest index having the highest priority.
+class InputAggregator(object):
+    def __init__(
+            self,
+            device_count,
+            axis_policy=OVERRIDE,
+            button_policy=OR):
+        assert(axis_policy in AXIS_POLICIES)
+        assert(button_policy in BUTTON_POLICIES)
+        self._axis_policy = axis_policy
+        self._button_policy = button_policy
+        self._inputs = [None] * device_count
+        self._timestamps = [None] * device_count
+        self._changed = False
+        self._last = None
+        self._combined = 0
+        self._merged = 0
+
+    @property
+    def timestamps(self):
+        # time of the last Input of each device (None if none yet)
+        return list(self._timestamps)
+
+    @property
+    def combined(self):
+        return self._combined
+
+    @property
+    def merged(self):
+        # number of device Inputs that did not lead to a message of their own
+        return self._merged
+
+    def update(self, index, input_, now=None):
+        if (now is None):
+            now = monotonic()
+        if (self._changed):
+            self._merged += 1
+        self._inputs[index] = input_
+        self._timestamps[index] = now
+        self._changed = True
+
+    def reset(self):
+        # the next Input built is returned even if it is the same as the
+        # previous one (a new game starts)
+        self._last = None
+
+    def build(self):
+        # returns the combined Input if it differs from the previous one,
+        # None otherwise
+        if (not self._changed):
+            return None
+        self._changed = False
+        inputs = [input_ for input_ in self._inputs if input_ is not None]
+        if (1 == len(inputs)):
+            combined = inputs[0]
+        else:
+            left, right = self._merge_axes(inputs)
+            fire_weapon1, fire_weapon2 = self._merge_buttons(inputs)
+            combined = Input(left, right, fire_weapon1, fire_weapon2)
+        key = (
+            combined.left,
+            combined.right,
+            combined.fire_weapon1,
+            combined.fire_weapon2)
+        if (key == self._last):
+            return None
+        self._last = key
+        self._combined += 1
+        return combined
+
+    def _merge_axes(self, inputs):
+        if (OVERRIDE == self._axis_policy):
+            for input_ in inputs:
+                if ((input_.left) or (input_.right)):
+                    return input_.left, input_.right
+            return 0, 0
+        left = max((input_.left for input_ in inputs), key=abs)
+        right = max((input_.right for input_ in inputs), key=abs)
+        return left, right
+
+    def _merge_buttons(self, inputs):
+        if (OR == self._button_policy):
+            return (
+                any(input_.fire_weapon1 for input_ in inputs),
+                any(input_.fire_weapon2 for input_ in inputs))
+        for input_ in inputs:
+            if ((input_.fire_weapon1) or (input_.fire_weapon2)):
+                return input_.fire_weapon1, input_.fire_weapon2
+        return False, False
+
+    def __str__(self):
+        return "(input aggregator, combined = " + str(self._combined) + \
+            "; merged = " + str(self._merged) + ")"
@@ -0,0 +1,74 @@
+from orwell.client.clock import monotonic
+
+
+# Sits between the devices and the PUSH socket. Inputs are sent at most once
+# per tick and only the newest one is kept in between. Changes of the fire
+# buttons are never delayed.
+class InputScheduler(object):
+    def __init__(self, send, rate):
+        assert(rate > 0)
+        self._send = send
+        self._period = 1.0 / rate
+        self._pending = None
+        self._last_sent = None
+        self._next_send = 0.0
+        self._sent = 0
+        self._coalesced = 0
+        self._edges = 0
+
+    @property
+    def sent(self):
+        return self._sent
+
+    @property
+    def coalesced(self):
+        return self._coalesced
+
+    @property
+    def edges(self):
+        return self._edges
+
+    @property
+    def next_deadline(self):
+        if (self._pending is None):
+            return None
+        return self._next_send
+
+    def submit(self, input_, now=None):
+        if (now is None):
+            now = monotonic()
+        if (self._pending is not None):
+            self._coalesced += 1
+        self._pending = input_
+        if (self._is_button_edge(input_)):
+            self._edges += 1
+            self._flush(now)
+        elif (now >= self._next_send):
+            self._flush(now)
+
+    def tick(self, now=None):
+        if (self._pending is None):
+            return
+        if (now is None):
+            now = monotonic()
+        if (now >= self._next_send):
+            self._flush(now)
+
+    def _is_button_edge(self, input_):
+        if (self._last_sent is None):
+            return True
+        return (
+            (self._last_sent.fire_weapon1 != input_.fire_weapon1) or
+            (self._last_sent.fire_weapon2 != input_.fire_weapon2))
+
+    def _flush(self, now):
+        self._send(self._pending)
+        self._last_sent = self._pending
+        self._pending = None
+        self._sent += 1
+        self._next_send = now + self._period
+
+    def __str__(self):
+        return "(input scheduler, sent = " + str(self._sent) + \
+            "; coalesced = " + str(self._coalesced) + \
+            "; edges = " + str(self._edges) + ")"
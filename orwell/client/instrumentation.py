@@ -0,0 +1,91 @@
+from orwell.client.clock import monotonic
+
+DEVICE_PROCESS = "device.process"
+BUILD_INPUT = "build_input"
+SERIALIZE = "serialize"
+SEND = "send"
+RECEIVE = "receive"
+
+
+# Counters are preallocated for a fixed list of stages and indexed by
+# position. When disabled start() returns None and stop() returns at once so
+# the cost is two calls per measured stage.
+class Instrumentation(object):
+    def __init__(self, stages, enabled=False):
+        self._stages = list(stages)
+        self._indices = dict(
+            (stage, index) for index, stage in enumerate(self._stages))
+        size = len(self._stages)
+        self._counts = [0] * size
+        self._totals = [0.0] * size
+        self._mins = [None] * size
+        self._maxs = [0.0] * size
+        self._enabled = enabled
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def enable(self):
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+
+    def index(self, stage):
+        return self._indices[stage]
+
+    def reset(self):
+        for index in range(len(self._stages)):
+            self._counts[index] = 0
+            self._totals[index] = 0.0
+            self._mins[index] = None
+            self._maxs[index] = 0.0
+
+    def start(self):
+        if (self._enabled):
+            return monotonic()
+        return None
+
+    def stop(self, index, started):
+        if (started is None):
+            return
+        duration = monotonic() - started
+        self._counts[index] += 1
+        self._totals[index] += duration
+        minimum = self._mins[index]
+        if ((minimum is None) or (duration < minimum)):
+            self._mins[index] = duration
+        if (duration > self._maxs[index]):
+            self._maxs[index] = duration
+
+    def snapshot(self):
+        snapshot = {}
+        for index, stage in enumerate(self._stages):
+            count = self._counts[index]
+            snapshot[stage] = {
+                "count": count,
+                "total": self._totals[index],
+                "min": self._mins[index],
+                "max": self._maxs[index],
+                "mean": (self._totals[index] / count) if count else None,
+            }
+        return snapshot
+
+    def __str__(self):
+        lines = ["(instrumentation, enabled = " + str(self._enabled) + ")"]
+        for index, stage in enumerate(self._stages):
+            count = self._counts[index]
+            if (not count):
+                continue
+            lines.append(
+                "{stage}: count = {count}; total = {total:.3f} s; "
+                "min = {min:.1f} us; mean = {mean:.1f} us; "
+                "max = {max:.1f} us".format(
+                    stage=stage,
+                    count=count,
+                    total=self._totals[index],
+                    min=self._mins[index] * 1e6,
+                    mean=self._totals[index] / count * 1e6,
+                    max=self._maxs[index] * 1e6))
+        return "\n".join(lines)
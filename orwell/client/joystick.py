@@ -1,12 +1,15 @@
 from __future__ import division
 import math
 from enum import Enum
-import logging
 
 import pygame
 
+from orwell.client import async_logging
 from orwell.client.device import Device
 from orwell.client.input import Input
+from orwell.client.mixing import LINEAR
+from orwell.client.mixing import MixingEngine
+from orwell.client.mixing import ResponseCurve
 
 XINPUT = "xinput"
 T_FLIGHT_HOTAS_X = "T.Flight Hotas X"
@@ -26,10 +29,76 @@ class JoystickType(Enum):
             return JoystickType.t_flight_hots_x
 
 
+# curves of the x, y and factor (throttle) axes of each type of joystick
+CURVES = {
+    JoystickType.xinput: (LINEAR, LINEAR, LINEAR),
+    JoystickType.t_flight_hots_x: (LINEAR, LINEAR, LINEAR),
+}
+# softer around the center, only used when asked for
+SHAPED_CURVES = {
+    JoystickType.xinput: (
+        ResponseCurve(dead_zone=0.02, expo=0.3),
+        ResponseCurve(dead_zone=0.02, expo=0.3),
+        LINEAR),
+    JoystickType.t_flight_hots_x: (
+        ResponseCurve(expo=0.2),
+        ResponseCurve(expo=0.2),
+        LINEAR),
+}
+
+
+def _get_joystick_id(pygame_joystick):
+    # pygame 2 identifies the joysticks in events by instance id
+    if (hasattr(pygame_joystick, "get_instance_id")):
+        return pygame_joystick.get_instance_id()
+    return pygame_joystick.get_id()
+
+
+def _get_event_joystick_id(event):
+    return getattr(event, "instance_id", event.joy)
+
+
+# The SDL event queue is shared by all the joysticks: the first device to
+# process reads every pending event and keeps the ones of the other devices
+# until they ask for them. Not thread safe: all the joysticks must be
+# processed from the same thread.
+class EventDispatcher(object):
+    JOYSTICK_EVENTS = (
+        pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP)
+
+    def __init__(self):
+        self._queues = {}
+
+    def register(self, joystick_id):
+        self._queues.setdefault(joystick_id, [])
+
+    def unregister(self, joystick_id):
+        self._queues.pop(joystick_id, None)
+
+    def get(self, joystick_id):
+        for event in pygame.event.get():
+            if (event.type not in EventDispatcher.JOYSTICK_EVENTS):
+                continue
+            queue = self._queues.get(_get_event_joystick_id(event))
+            if (queue is not None):
+                queue.append(event)
+        queue = self._queues.get(joystick_id)
+        if (not queue):
+            return []
+        self._queues[joystick_id] = []
+        return queue
+
+
+DISPATCHER = EventDispatcher()
+
+
 # No test yet
 class Joystick(Device):
     ANGLE_MIN = 0.0
     ANGLE_MAX = math.pi * 0.5
+    # pygame does not expose a file descriptor for joystick events so the
+    # event loop has to sample the joystick at a fixed rate
+    POLL_INTERVAL = 0.01
 
     JOYSTICKS = {}
 
@@ -39,15 +108,25 @@ class Joystick(Device):
             pygame_joystick,
             dead_zone,
             angle=math.pi * 0.25,
-            precision=0.025):
+            precision=0.025,
+            curves=None,
+            shaped_curves=False):
         LOGGER.debug("get_joystick IN")
-        if (pygame_joystick.get_name() in cls.JOYSTICKS.keys()):
-            joystick = cls.JOYSTICKS[pygame_joystick.get_name()]
+        # two joysticks of the same model only differ by their id
+        key = (pygame_joystick.get_name(), _get_joystick_id(pygame_joystick))
+        if (key in cls.JOYSTICKS.keys()):
+            joystick = cls.JOYSTICKS[key]
             LOGGER.debug("get_joystick OUT memo")
             return joystick
         else:
-            joystick = Joystick(pygame_joystick, dead_zone, angle, precision)
-            cls.JOYSTICKS[pygame_joystick.get_name()] = joystick
+            joystick = Joystick(
+                pygame_joystick,
+                dead_zone,
+                angle,
+                precision,
+                curves=curves,
+                shaped_curves=shaped_curves)
+            cls.JOYSTICKS[key] = joystick
             LOGGER.debug("get_joystick OUT new")
             return joystick
 
@@ -56,11 +135,33 @@ class Joystick(Device):
             pygame_joystick,
             dead_zone,
             angle,
-            precision):
+            precision,
+            dispatcher=DISPATCHER,
+            curves=None,
+            shaped_curves=False):
         assert(Joystick.ANGLE_MIN < angle < Joystick.ANGLE_MAX)
         self._dead_zone = dead_zone
         self._joystick_type = JoystickType.build(pygame_joystick.get_name())
         self._angle = angle
+        if (curves is None):
+            if (shaped_curves):
+                curves = SHAPED_CURVES[self._joystick_type]
+            else:
+                curves = CURVES[self._joystick_type]
+        x_curve, y_curve, factor_curve = curves
+        self._mixer = MixingEngine(
+            angle,
+            precision,
+            dead_zone,
+            x_curve=x_curve,
+            y_curve=y_curve,
+            factor_curve=factor_curve)
+        if (JoystickType.xinput == self._joystick_type):
+            self._factor_axis = 7
+            self._factor_sign = 1
+        else:
+            self._factor_axis = 2
+            self._factor_sign = -1
         self._invert_direction = -1
         self._precision = float(precision)
         self.left = 0
@@ -82,58 +183,54 @@ class Joystick(Device):
             pygame_joystick.init()
             LOGGER.debug("buttons: " + str(pygame_joystick.get_numbuttons()))
             LOGGER.debug("axes: " + str(pygame_joystick.get_numaxes()))
+        self._dispatcher = dispatcher
+        self._joystick_id = _get_joystick_id(pygame_joystick)
+        dispatcher.register(self._joystick_id)
+        # the events only give changes, start from the current position
+        self._axes = [
+            pygame_joystick.get_axis(axis)
+            for axis in range(pygame_joystick.get_numaxes())]
+        self._buttons = [
+            (pygame_joystick.get_button(button) != 0)
+            for button in range(pygame_joystick.get_numbuttons())]
+        self._axes_changed = True
+        self._buttons_changed = True
 
     def __del__(self):
+        self._dispatcher.unregister(self._joystick_id)
         if (self._pygame_joystick.get_init()):
             self._pygame_joystick.quit()
 
-    def _round(self, value):
-        new_value = int(value / self._precision) * self._precision
-        if (math.fabs(new_value) < self._dead_zone):
-            new_value = 0
-        return new_value
-
     def process(self):
-        for event in pygame.event.get():
-            if event.type == pygame.JOYBUTTONDOWN:
-                print("Joystick button pressed.")
-            if event.type == pygame.JOYBUTTONUP:
-                print("Joystick button released.")
-        x = -self._pygame_joystick.get_axis(0)
-        # print("x = " + str(x))
-        y = self._pygame_joystick.get_axis(1)
-        # print("y = " + str(y))
+        for event in self._dispatcher.get(self._joystick_id):
+            if (pygame.JOYAXISMOTION == event.type):
+                self._axes[event.axis] = event.value
+                self._axes_changed = True
+            else:
+                self._buttons[event.button] = (
+                    pygame.JOYBUTTONDOWN == event.type)
+                self._buttons_changed = True
+                if (pygame.JOYBUTTONDOWN == event.type):
+                    self._on_button_down(event.button)
         if (self._debug):
-            if (self._pygame_joystick.get_button(2) != 0):
+            if (self._buttons[2]):
                 # X
                 self._angle -= 0.0001
+                self._axes_changed = True
                 print("angle = " + str(self._angle))
-            if (self._pygame_joystick.get_button(1) != 0):
+            if (self._buttons[1]):
                 # B
                 self._angle += 0.0001
+                self._axes_changed = True
                 print("angle = " + str(self._angle))
-            if (self._pygame_joystick.get_button(3) != 0):
-                # Y
-                self._toggle_direction()
-        if (JoystickType.xinput == self._joystick_type):
-            # Gamepad
-            factor = self._invert_direction * self._pygame_joystick.get_axis(7)
-            # print("factor = " + str(factor))
-            # left button (not arrow)
-            self.fire_weapon1 = (self._pygame_joystick.get_button(4) != 0)
-            # left trigger
-            self.fire_weapon2 = (self._pygame_joystick.get_button(6) != 0)
-            self.start = (self._pygame_joystick.get_button(9) != 0)
-        else:
-            # HOTAS
-            factor = -self._invert_direction * self._pygame_joystick.get_axis(2)
-            # print("factor = " + str(factor))
-            self.fire_weapon1 = (self._pygame_joystick.get_button(1) != 0)
-            self.fire_weapon2 = (self._pygame_joystick.get_button(0) != 0)
-            self.start = (self._pygame_joystick.get_button(11) != 0)
-            if (self._pygame_joystick.get_button(3) != 0):
-                self._ping = True
-        self._convert(x, y, factor)
+        if (self._buttons_changed):
+            self._read_buttons()
+            self._buttons_changed = False
+        if (self._axes_changed):
+            factor = (self._factor_sign * self._invert_direction *
+                      self._axes[self._factor_axis])
+            self._convert(-self._axes[0], self._axes[1], factor)
+            self._axes_changed = False
         self._has_new_values = (
                 (self._previous_left != self.left) or
                 (self._previous_right != self.right) or
@@ -141,41 +238,54 @@ class Joystick(Device):
                 (self._previous_fire_weapon2 != self.fire_weapon2) or
                 (self._previous_start != self.start))
         if (self._has_new_values):
-            LOGGER.debug("has new value ? " + str(self._has_new_values))
+            LOGGER.debug("has new value ? %s", self._has_new_values)
         self._previous_left = self.left
         self._previous_right = self.right
         self._previous_fire_weapon1 = self.fire_weapon1
         self._previous_fire_weapon2 = self.fire_weapon2
         self._previous_start = self.start
 
+    def _on_button_down(self, button):
+        if ((self._debug) and (3 == button)):
+            # Y
+            self._toggle_direction()
+            self._axes_changed = True
+        if ((JoystickType.xinput != self._joystick_type) and (3 == button)):
+            self._ping = True
+
+    def _read_buttons(self):
+        if (JoystickType.xinput == self._joystick_type):
+            # Gamepad
+            # left button (not arrow)
+            self.fire_weapon1 = self._buttons[4]
+            # left trigger
+            self.fire_weapon2 = self._buttons[6]
+            self.start = self._buttons[9]
+        else:
+            # HOTAS
+            self.fire_weapon1 = self._buttons[1]
+            self.fire_weapon2 = self._buttons[0]
+            self.start = self._buttons[11]
+
     def _toggle_direction(self):
         self._invert_direction = -self._invert_direction
 
     def _convert(self, x, y, factor):
-        cosine = math.cos(self._angle)
-        sine = math.sin(self._angle)
-        scale = (cosine + sine) * 0.5
-        # print("x =", x, "; y =", y, "; factor =", factor)
-        # print("cosine =", cosine, "; sine =", sine, "; scale =", scale)
-        # print("x * cosine =", x * cosine, "; y * sine =", sine)
-        big_left = self._round(factor * (
-            x * cosine +
-            y * sine) / scale)
-        big_right = self._round(factor * (
-            y * cosine -
-            x * sine) / scale)
-        # print("big_left =", big_left, "; big_right =", big_right)
-        self.left = max(-1, min(
-                1,
-                big_left))
-        self.right = max(-1, min(
-                1,
-                big_right))
+        self._mixer.angle = self._angle
+        self.left, self.right = self._mixer.mix(x, y, factor)
+
+    @property
+    def mixer(self):
+        return self._mixer
 
     @property
     def has_new_values(self):
         return self._has_new_values
 
+    @property
+    def poll_interval(self):
+        return Joystick.POLL_INTERVAL
+
     def build_input(self):
         LOGGER.debug("build_input")
         return Input(
@@ -194,15 +304,5 @@ class Joystick(Device):
 
 def configure_logging(verbose):
     global LOGGER
-    print("joystick.configure_logging")
-    LOGGER = logging.getLogger(__name__)
-    LOGGER.propagate = False
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-            '%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
-    handler.setFormatter(formatter)
-    LOGGER.addHandler(handler)
-    if (verbose):
-        LOGGER.setLevel(logging.DEBUG)
-    else:
-        LOGGER.setLevel(logging.INFO)
+    # records are formatted and written by the logging thread
+    LOGGER = async_logging.configure(__name__, verbose)
@@ -1,137 +1,130 @@
 from __future__ import division
-import math
-from enum import Enum
-import logging
 
 from pynput import keyboard
 
+from orwell.client.acquisition import RingBuffer
+from orwell.client import async_logging
+from orwell.client.clock import monotonic
 from orwell.client.device import Device
 from orwell.client.input import Input
 
 
+# The pynput listener runs its own thread: every key change pushes a
+# timestamped snapshot of the keys in a ring buffer that the device reads
+# without blocking.
 class KeyboardThread(object):
-    def __init__(self):
+    def __init__(self, capacity=64):
         self._left = False
         self._right = False
         self._enter = False
         self._space = False
         self._p = False
-        # Collect events until released
-        with keyboard.Listener(
+        self._buffer = RingBuffer(capacity)
+        self._listener = keyboard.Listener(
                 on_press=self.on_press,
-                on_release=self.on_release) as listener:
-            listener.join()
-
-    @property
-    def left(self):
-        return self._left
-
-    @property
-    def right(self):
-        return self._right
-
-    @property
-    def enter(self):
-        return self._enter
-
-    @property
-    def space(self):
-        return self._space
+                on_release=self.on_release)
+        self._listener.daemon = True
+        self._listener.start()
 
     @property
-    def p(self):
-        return self._p
-
-    def on_press(key):
-        try:
-            if (keyboard.Key.left == key):
-                self._left = True
-            elif (keyboard.Key.right == key):
-                self._right = True
-            elif (keyboard.Key.enter == key):
-                self._enter = True
-            elif (keyboard.Key.space == key):
-                self._space = True
-            elif (keyboard.KeyCode.from_char('p') == key):
-                self._p = True
-        except AttributeError:
-            print('special key {0} pressed'.format(key))
-
-    def on_release(key):
-        try:
-            if (keyboard.Key.left == key):
-                self._left = False
-            elif (keyboard.Key.right == key):
-                self._right = False
-            elif (keyboard.Key.enter == key):
-                self._enter = False
-            elif (keyboard.Key.space == key):
-                self._space = False
-            elif (keyboard.KeyCode.from_char('p') == key):
-                self._p = False
-        except AttributeError:
-            print('special key {0} released'.format(key))
+    def buffer(self):
+        # (timestamp, left, right, enter, space, p) tuples
+        return self._buffer
+
+    def stop(self):
+        self._listener.stop()
+
+    def on_press(self, key):
+        self._update(key, True)
+
+    def on_release(self, key):
+        self._update(key, False)
+
+    def _update(self, key, pressed):
+        if (keyboard.Key.left == key):
+            self._left = pressed
+        elif (keyboard.Key.right == key):
+            self._right = pressed
+        elif (keyboard.Key.enter == key):
+            self._enter = pressed
+        elif (keyboard.Key.space == key):
+            self._space = pressed
+        elif (keyboard.KeyCode.from_char('p') == key):
+            self._p = pressed
+        else:
+            return
+        self._buffer.push((
+            monotonic(),
+            self._left,
+            self._right,
+            self._enter,
+            self._space,
+            self._p))
 
 
 # No test yet
 class Keyboard(Device):
+    # the pynput listener does not expose anything to poll so the event loop
+    # has to check the ring buffer at a fixed rate
+    POLL_INTERVAL = 0.02
+
     def __init__(self):
         self._left = False
         self._right = False
         self._fire_weapon1 = False
         self._fire_weapon2 = False
         self._ping = False
+        self._timestamp = None
         self._keyboard_thread = KeyboardThread()
         self._has_new_values = False
 
+    def __del__(self):
+        self._keyboard_thread.stop()
+
+    @property
+    def timestamp(self):
+        # when the keys last changed
+        return self._timestamp
+
     def process(self):
-        left = self._keyboard_thread.left
-        if (self._left != left):
-            self._has_new_values = True
-            self._left = left
-        right = self._keyboard_thread.right
-        if (self._right != right):
-            self._has_new_values = True
-            self._right = right
-        fire_weapon1 = self._keyboard_thread.enter
-        if (self._fire_weapon1 != fire_weapon1):
-            self._has_new_values = True
-            self._fire_weapon1 = fire_weapon1
-        fire_weapon2 = self._keyboard_thread.space
-        if (self._fire_weapon2 != fire_weapon2):
-            self._has_new_values = True
-            self._fire_weapon2 = fire_weapon2
-        ping = self._keyboard_thread.p
-        if (ping):
-            self._ping = True
+        self._has_new_values = False
+        for (timestamp, left, right, enter, space, p) in \
+                self._keyboard_thread.buffer.pop_all():
+            if ((self._left != left) or
+                    (self._right != right) or
+                    (self._fire_weapon1 != enter) or
+                    (self._fire_weapon2 != space)):
+                self._has_new_values = True
+                self._left = left
+                self._right = right
+                self._fire_weapon1 = enter
+                self._fire_weapon2 = space
+                self._timestamp = timestamp
+            if (p):
+                self._ping = True
 
     @property
     def has_new_values(self):
         return self._has_new_values
 
+    @property
+    def poll_interval(self):
+        return Keyboard.POLL_INTERVAL
+
     def build_input(self):
         return Input(
-                self.left,
-                self.right,
-                self.fire_weapon1,
-                self.fire_weapon2)
+                float(self._left),
+                float(self._right),
+                self._fire_weapon1,
+                self._fire_weapon2)
 
-        def read_ping(self):
-            if (self._ping):
-                self._ping = False
-                return True
-            else:
-                return False
+    def read_ping(self):
+        if (self._ping):
+            self._ping = False
+            return True
+        else:
+            return False
 
 
 def configure_logging(verbose):
-    logger = logging.getLogger(__name__)
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-            '%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-    if (verbose):
-        logger.setLevel(logging.DEBUG)
-    else:
-        logger.setLevel(logging.INFO)
+    async_logging.configure(__name__, verbose)
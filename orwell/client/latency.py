@@ -0,0 +1,215 @@
+from __future__ import division
+import math
+import time
+
+from orwell.client.clock import monotonic
+
+
+# Log-linear histogram of durations (in seconds) with a fixed number of
+# buckets: each bucket is 2 ** (1 / buckets_per_octave) wider than the
+# previous one so the relative error stays the same over the whole range.
+class Histogram(object):
+    def __init__(self, lowest=1e-5, highest=60.0, buckets_per_octave=16):
+        assert(0 < lowest < highest)
+        self._lowest = lowest
+        self._log_factor = math.log(2) / buckets_per_octave
+        size = int(math.ceil(math.log(highest / lowest) / self._log_factor))
+        # one more bucket for values below lowest and one for values above
+        # highest
+        self._counts = [0] * (size + 2)
+        self.reset()
+
+    def reset(self):
+        for index in range(len(self._counts)):
+            self._counts[index] = 0
+        self._count = 0
+        self._total = 0.0
+        self._min = None
+        self._max = None
+
+    def _index(self, value):
+        if (value <= self._lowest):
+            return 0
+        index = 1 + int(math.log(value / self._lowest) / self._log_factor)
+        return min(index, len(self._counts) - 1)
+
+    def _upper_bound(self, index):
+        return self._lowest * math.exp(index * self._log_factor)
+
+    def record(self, value):
+        self._counts[self._index(value)] += 1
+        self._count += 1
+        self._total += value
+        if ((self._min is None) or (value < self._min)):
+            self._min = value
+        if ((self._max is None) or (value > self._max)):
+            self._max = value
+
+    def merge(self, other):
+        # both histograms must have been built with the same parameters
+        assert(len(self._counts) == len(other._counts))
+        for index, count in enumerate(other._counts):
+            self._counts[index] += count
+        self._count += other._count
+        self._total += other._total
+        if (other._min is not None):
+            if ((self._min is None) or (other._min < self._min)):
+                self._min = other._min
+            if ((self._max is None) or (other._max > self._max)):
+                self._max = other._max
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def min(self):
+        return self._min
+
+    @property
+    def max(self):
+        return self._max
+
+    @property
+    def mean(self):
+        if (0 == self._count):
+            return None
+        return self._total / self._count
+
+    def percentile(self, percent):
+        if (0 == self._count):
+            return None
+        threshold = self._count * percent / 100
+        cumulated = 0
+        # the last bucket has no upper bound, only the max is known
+        for index, count in enumerate(self._counts[:-1]):
+            cumulated += count
+            if ((cumulated >= threshold) and (count > 0)):
+                return min(self._upper_bound(index), self._max)
+        return self._max
+
+    def summary(self):
+        return {
+            "count": self._count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self._max,
+        }
+
+    def __str__(self):
+        if (0 == self._count):
+            return "(count = 0)"
+        return ("(count = {count}; p50 = {p50:.2f} ms; p95 = {p95:.2f} ms; "
+                "p99 = {p99:.2f} ms; max = {max:.2f} ms)").format(
+            count=self._count,
+            p50=self.percentile(50) * 1000,
+            p95=self.percentile(95) * 1000,
+            p99=self.percentile(99) * 1000,
+            max=self._max * 1000)
+
+
+# Sends sequence numbered pings (the sequence number is stored in the logger
+# of the timing event added by the client) and measures the round trip with
+# a monotonic clock. The elapsed time of every other hop reported in the
+# Pong is also kept.
+class LatencyMonitor(object):
+    def __init__(
+            self,
+            send,
+            name,
+            interval=None,
+            max_in_flight=8,
+            timeout=5.0):
+        self._send = send
+        self._prefix = name + "/"
+        self._interval = interval
+        self._max_in_flight = max_in_flight
+        self._timeout = timeout
+        self._sequence = 0
+        self._in_flight = {}
+        self._lost = 0
+        self._round_trip = Histogram()
+        self._hops = {}
+        if (interval):
+            self._next_ping = monotonic() + interval
+        else:
+            self._next_ping = None
+
+    @property
+    def round_trip(self):
+        return self._round_trip
+
+    @property
+    def hops(self):
+        return self._hops
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    @property
+    def lost(self):
+        return self._lost
+
+    @property
+    def next_deadline(self):
+        return self._next_ping
+
+    def ping(self, now=None):
+        if (len(self._in_flight) >= self._max_in_flight):
+            return False
+        if (now is None):
+            now = monotonic()
+        self._sequence += 1
+        # imported here to keep start up fast
+        import orwell.messages.controller_pb2 as pb_controller
+        pb_ping = pb_controller.Ping()
+        timing_event = pb_ping.timing.add()
+        timing_event.logger = self._prefix + str(self._sequence)
+        # the server only understands wall clock timestamps
+        timing_event.timestamp = int(round(time.time() * 1000))
+        self._in_flight[self._sequence] = now
+        self._send(pb_ping.SerializeToString())
+        return True
+
+    def tick(self, now=None):
+        if (now is None):
+            now = monotonic()
+        if (self._in_flight):
+            expired = [
+                sequence for sequence, sent in self._in_flight.items()
+                if (now - sent > self._timeout)]
+            for sequence in expired:
+                del self._in_flight[sequence]
+                self._lost += 1
+        if ((self._next_ping is not None) and (now >= self._next_ping)):
+            self.ping(now)
+            self._next_ping = now + self._interval
+
+    def handle_pong(self, pong, now=None):
+        if (now is None):
+            now = monotonic()
+        for timing in pong.timing:
+            if (timing.logger.startswith(self._prefix)):
+                try:
+                    sequence = int(timing.logger[len(self._prefix):])
+                except ValueError:
+                    # not one of ours
+                    continue
+                sent = self._in_flight.pop(sequence, None)
+                if (sent is not None):
+                    self._round_trip.record(now - sent)
+            else:
+                if (timing.logger not in self._hops):
+                    self._hops[timing.logger] = Histogram()
+                # elapsed is given in milliseconds
+                self._hops[timing.logger].record(timing.elapsed / 1000)
+
+    def __str__(self):
+        text = "(latency, in flight = " + str(len(self._in_flight)) + \
+            "; lost = " + str(self._lost) + \
+            "; round trip = " + str(self._round_trip)
+        for logger in sorted(self._hops):
+            text += "; " + logger + " = " + str(self._hops[logger])
+        return text + ")"
@@ -0,0 +1,218 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import logging
+import multiprocessing
+import threading
+
+import zmq
+
+from orwell.client import async_logging
+from orwell.client import runner as runner_module
+from orwell.client.clock import monotonic
+from orwell.client import fake_server
+from orwell.client import framing
+from orwell.client.fake_server import FakeServer
+from orwell.client.fake_server import STAMP_PREFIX
+from orwell.client import handshake
+from orwell.client.latency import Histogram
+from orwell.client.scripted_device import ScriptedDevice
+from orwell.client.scripted_device import build_sweep
+
+LOGGER = None
+
+
+class WorkerResult(object):
+    def __init__(self):
+        self.clients = 0
+        self.failed = 0
+        self.handshake = Histogram()
+        self.fan_out = Histogram()
+
+    def merge(self, other):
+        self.clients += other.clients
+        self.failed += other.failed
+        self.handshake.merge(other.handshake)
+        self.fan_out.merge(other.fan_out)
+
+
+# Given to each runner as its capture: reads the publication time stamped
+# by the server in the GameState messages as soon as they are received,
+# without going through the GameStateStore.
+class StampWatcher(object):
+    def __init__(self, result, lock):
+        self._result = result
+        self._lock = lock
+
+    def write(self, frames):
+        now = monotonic()
+        message_wrapper = framing.unwrap(frames)
+        if ((message_wrapper is None) or
+                ("GameState" != message_wrapper.message_type)):
+            return
+        winner = message_wrapper.message.winner
+        if (winner.startswith(STAMP_PREFIX)):
+            with self._lock:
+                self._result.fan_out.record(now - float(winner[1:]))
+
+
+def _run_client(runner, result, lock):
+    try:
+        runner.run()
+    except Exception:
+        LOGGER.exception("client failed")
+        with lock:
+            result.failed += 1
+        return
+    with lock:
+        result.clients += 1
+        if (runner.handshake_time is not None):
+            result.handshake.record(runner.handshake_time)
+
+
+def run_worker(arguments):
+    # one process running several headless runners that share a zmq context
+    (clients, duration, input_rate, push_address, subscribe_address,
+        reply_address) = arguments
+    configure_logging(False)
+    for module in (runner_module, handshake):
+        module.configure_logging(False)
+        logging.getLogger(module.__name__).setLevel(logging.WARNING)
+    context = zmq.Context()
+    result = WorkerResult()
+    lock = threading.Lock()
+    runners = []
+    threads = []
+    for _ in range(clients):
+        device = ScriptedDevice(build_sweep(1000), interval=1.0 / input_rate)
+        runner = runner_module.Runner(
+            [device],
+            push_address=push_address,
+            subscribe_address=subscribe_address,
+            reply_address=reply_address,
+            event_driven=True,
+            report_interval=duration * 2,
+            capture=StampWatcher(result, lock),
+            context=context)
+        runners.append(runner)
+        thread = threading.Thread(
+            target=_run_client, args=(runner, result, lock))
+        thread.daemon = True
+        threads.append(thread)
+    for thread in threads:
+        thread.start()
+    timer = threading.Timer(
+        duration, lambda: [runner.stop() for runner in runners])
+    timer.start()
+    for thread in threads:
+        thread.join()
+    for runner in runners:
+        runner.destroy()
+    context.term()
+    # the pool may end the process without waiting for the logging thread
+    async_logging.shutdown()
+    return result
+
+
+def run(processes, clients, duration, input_rate, game_state_rate, port):
+    push_address = "tcp://127.0.0.1:" + str(port)
+    subscribe_address = "tcp://127.0.0.1:" + str(port + 1)
+    reply_address = "tcp://127.0.0.1:" + str(port + 2)
+    # the workers are forked before the server thread and its zmq context
+    # exist, a live context must not be copied into a child process
+    pool = multiprocessing.Pool(processes)
+    try:
+        server = FakeServer(
+            push_address=push_address,
+            subscribe_address=subscribe_address,
+            reply_address=reply_address,
+            discovery_port=None,
+            game_state_rate=game_state_rate,
+            stamp_game_states=True)
+        server.start()
+        # spread the clients as evenly as possible over the processes
+        shares = [clients // processes] * processes
+        for index in range(clients % processes):
+            shares[index] += 1
+        started = monotonic()
+        results = pool.map(
+            run_worker,
+            [
+                (share, duration, input_rate, push_address,
+                    subscribe_address, reply_address)
+                for share in shares if share])
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = monotonic() - started
+    server.stop()
+    report = WorkerResult()
+    for result in results:
+        report.merge(result)
+    return report, server.inputs / elapsed, server
+
+
+def parse():
+    parser = argparse.ArgumentParser(
+        description='Run many headless clients against a fake server.')
+    parser.add_argument(
+        '--clients',
+        help='Total number of clients',
+        type=int,
+        default=32)
+    parser.add_argument(
+        '--processes',
+        help='Number of processes the clients are spread over',
+        type=int,
+        default=multiprocessing.cpu_count())
+    parser.add_argument(
+        '--duration',
+        help='Duration of the test in seconds',
+        type=float,
+        default=10.0)
+    parser.add_argument(
+        '--input-rate',
+        help='Inputs produced per second by each scripted device',
+        type=float,
+        default=60.0)
+    parser.add_argument(
+        '--game-state-rate',
+        help='GameState messages published per second',
+        type=float,
+        default=10.0)
+    parser.add_argument(
+        '--port',
+        help='First of the three consecutive ports used by the server',
+        type=int,
+        default=19000)
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse()
+    fake_server.configure_logging(False)
+    logging.getLogger(fake_server.__name__).setLevel(logging.WARNING)
+    report, inputs_per_second, server = run(
+        arguments.processes,
+        arguments.clients,
+        arguments.duration,
+        arguments.input_rate,
+        arguments.game_state_rate,
+        arguments.port)
+    print("clients: " + str(report.clients) +
+          " (failed: " + str(report.failed) + ")")
+    print("handshake: " + str(report.handshake))
+    print("inputs: {0:.0f} msg/s".format(inputs_per_second))
+    print("GameState fan out: " + str(report.fan_out))
+    print(str(server))
+    async_logging.shutdown()
+
+
+def configure_logging(verbose):
+    global LOGGER
+    # records are formatted and written by the logging thread
+    LOGGER = async_logging.configure(__name__, verbose)
+
+
+if ("__main__" == __name__):
+    main()
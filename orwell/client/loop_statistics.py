@@ -0,0 +1,97 @@
+class LoopStatistics(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._idle_time = 0.0
+        self._busy_time = 0.0
+        self._wakeups = 0
+
+    def add_idle(self, duration):
+        self._idle_time += duration
+
+    def add_busy(self, duration):
+        self._busy_time += duration
+        self._wakeups += 1
+
+    @property
+    def idle_time(self):
+        return self._idle_time
+
+    @property
+    def busy_time(self):
+        return self._busy_time
+
+    @property
+    def wakeups(self):
+        return self._wakeups
+
+    @property
+    def idle_ratio(self):
+        total = self._idle_time + self._busy_time
+        if (0 == total):
+            return 0.0
+        return self._idle_time / total
+
+    @property
+    def busy_ratio(self):
+        total = self._idle_time + self._busy_time
+        if (0 == total):
+            return 0.0
+        return self._busy_time / total
+
+    def __str__(self):
+        return "(loop, wakeups = " + str(self._wakeups) + \
+            "; idle = {0:.1%}; busy = {1:.1%})".format(
+                self.idle_ratio, self.busy_ratio)
+
+
+class DrainStatistics(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._received = 0
+        self._dropped = 0
+        self._drains = 0
+        self._last_depth = 0
+        self._max_depth = 0
+        self._budget_exhausted = 0
+
+    def add_drain(self, depth, budget_exhausted):
+        self._drains += 1
+        self._received += depth
+        self._last_depth = depth
+        if (depth > self._max_depth):
+            self._max_depth = depth
+        if (budget_exhausted):
+            self._budget_exhausted += 1
+
+    def add_dropped(self):
+        self._dropped += 1
+
+    @property
+    def received(self):
+        return self._received
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    @property
+    def last_depth(self):
+        return self._last_depth
+
+    @property
+    def max_depth(self):
+        return self._max_depth
+
+    @property
+    def budget_exhausted(self):
+        return self._budget_exhausted
+
+    def __str__(self):
+        return "(drain, received = " + str(self._received) + \
+            "; dropped = " + str(self._dropped) + \
+            "; max depth = " + str(self._max_depth) + \
+            "; budget exhausted = " + str(self._budget_exhausted) + ")"
@@ -1,20 +1,39 @@
 from __future__ import print_function
+from orwell.client.clock import monotonic
+IMPORTS_STARTED = monotonic()
+
 import argparse
-import logging
 import os
 import random
 import sys
 
-import pygame
 import signal
 
-from orwell.client.joystick import Joystick
+from orwell.client import acquisition
+from orwell.client import async_logging
+from orwell.client import broadcast
+from orwell.client import framing
+from orwell.client import handshake
+from orwell.client.broadcast import Discovery
+from orwell.client.capture import CaptureWriter
+from orwell.client import discovery_cache as discovery_cache_module
+from orwell.client.discovery_cache import DiscoveryCache
+from orwell.client import input_aggregator
+from orwell.client import push_sender
+from orwell.client import recording
+from orwell.client import runner as runner_module
 from orwell.client.runner import Runner
+from orwell.client import startup
 
+LOGGER = None
 RUNNER = None
+# EventRing of the runner and where to dump it
+EVENT_RING = None
+EVENT_RING_PATH = None
 
 
 def parse():
+    global LOGGER
     parser = argparse.ArgumentParser(description='Client.')
     parser.add_argument(
         '--connection',
@@ -27,31 +46,199 @@ def parse():
         dest='joystick',
         default=True,
         action="store_false")
+    parser.add_argument(
+        '--event-loop',
+        help='Wait for network traffic, device events or deadlines instead '
+        'of spinning',
+        dest='event_driven',
+        default=False,
+        action="store_true")
+    parser.add_argument(
+        '--input-rate',
+        help='Send inputs at most this many times per second (Hz), only '
+        'keeping the newest values ; button changes are sent immediately',
+        type=float,
+        default=None)
+    parser.add_argument(
+        '--wire-format',
+        help='How routing id, message type and payload are framed ; auto '
+        'switches to multipart if the server answers with multipart',
+        choices=framing.WIRE_FORMATS,
+        default=framing.SPACE_DELIMITED)
+    parser.add_argument(
+        '--prefill-input-cache',
+        help='Frame every possible Input message as soon as the routing id '
+        'is known instead of on first use',
+        default=False,
+        action="store_true")
+    parser.add_argument(
+        '--drain-budget',
+        help='Maximum number of messages handled per loop iteration',
+        type=int,
+        default=100)
+    parser.add_argument(
+        '--stale-game-states',
+        help='Keep every GameState, drop the ones already replaced by a '
+        'newer one or let zmq conflate the SUB socket',
+        choices=runner_module.STALE_GAME_STATE_POLICIES,
+        default=runner_module.KEEP_GAME_STATES)
+    parser.add_argument(
+        '--axis-policy',
+        help='How the axes of several devices are combined: the first '
+        'device not at rest wins or the largest value wins',
+        choices=input_aggregator.AXIS_POLICIES,
+        default=input_aggregator.OVERRIDE)
+    parser.add_argument(
+        '--button-policy',
+        help='How the buttons of several devices are combined',
+        choices=input_aggregator.BUTTON_POLICIES,
+        default=input_aggregator.OR)
+    parser.add_argument(
+        '--send-policy',
+        help='What to do when the server does not keep up: block the loop, '
+        'only keep the newest input or only keep the newest input but '
+        'deliver every change of the buttons',
+        choices=push_sender.SEND_POLICIES,
+        default=push_sender.BLOCK)
+    parser.add_argument(
+        '--send-hwm',
+        help='Maximum number of messages queued by zmq on the PUSH socket '
+        '(zmq default if not given)',
+        type=int,
+        default=None)
+    parser.add_argument(
+        '--ping-interval',
+        help='Send a Ping every this many seconds to measure latency',
+        type=float,
+        default=None)
+    parser.add_argument(
+        '--shaped-curves',
+        help='Soften the joystick axes around the center (dead zone and '
+        'expo) instead of using them as they are',
+        default=False,
+        action="store_true")
+    parser.add_argument(
+        '--instrument',
+        help='Measure the time spent in each stage of the main loop ; send '
+        'SIGUSR1 to log a snapshot',
+        default=False,
+        action="store_true")
+    parser.add_argument(
+        '--no-discovery-cache',
+        help='Always broadcast to find the server instead of trying the '
+        'addresses found last time first',
+        dest='discovery_cache',
+        default=True,
+        action="store_false")
+    parser.add_argument(
+        '--discovery-cache-ttl',
+        help='Seconds during which the addresses found are reused',
+        type=float,
+        default=24 * 3600)
+    parser.add_argument(
+        '--discovery-window',
+        help='Wait this many seconds after the first server answers for '
+        'other servers and pick the one with the lowest round trip',
+        type=float,
+        default=None)
+    parser.add_argument(
+        '--input-threads',
+        help='Read the devices on this many background threads instead of '
+        'the network loop (0 to disable, at most 1 with joysticks)',
+        type=int,
+        default=0)
+    parser.add_argument(
+        '--record',
+        help='Record what the devices produce to this file',
+        default=None)
+    parser.add_argument(
+        '--replay',
+        help='Play this recording instead of reading the devices',
+        default=None)
+    parser.add_argument(
+        '--replay-fast',
+        help='Play one sample of the recording per loop instead of '
+        'following its timing',
+        default=False,
+        action="store_true")
+    parser.add_argument(
+        '--capture',
+        help='Write every message received from the server to this file '
+        '(replay it with python -m orwell.client.capture)',
+        default=None)
+    parser.add_argument(
+        '--handshake-timeout',
+        help='Seconds to wait for the reply to each Hello',
+        type=float,
+        default=2.5)
+    parser.add_argument(
+        '--handshake-retries',
+        help='Number of times Hello is sent again before giving up',
+        type=int,
+        default=3)
+    parser.add_argument(
+        '--event-ring',
+        help='Keep the last events of the loop in memory and dump them to '
+        'this file on SIGUSR2 and at exit',
+        default=None)
+    parser.add_argument(
+        '--profile-startup',
+        help='Log the time spent in each phase until the first Welcome',
+        default=False,
+        action="store_true")
     parser.add_argument(
         '--verbose', '-v',
         help='Verbose mode',
         default=False,
         action="store_true")
     arguments = parser.parse_args()
-    log = logging.getLogger(__name__)
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-            '%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
-    handler.setFormatter(formatter)
-    log.addHandler(handler)
-    if (arguments.verbose):
-        log.setLevel(logging.DEBUG)
-    else:
-        log.setLevel(logging.INFO)
-    from orwell.client import runner
-    runner.configure_logging(arguments.verbose)
-    if (arguments.joystick):
-        from orwell.client import joystick
-        joystick.configure_logging(arguments.verbose)
+    if ((arguments.joystick) and (not arguments.replay) and
+            (arguments.input_threads > 1)):
+        # the joysticks share the SDL event queue, only one thread may read it
+        parser.error("--input-threads above 1 needs --no-joystick")
+    if ((runner_module.CONFLATE_GAME_STATES ==
+            arguments.stale_game_states) and
+            (framing.SPACE_DELIMITED != arguments.wire_format)):
+        # zmq can not conflate multipart messages
+        parser.error(
+            "--stale-game-states conflate needs --wire-format " +
+            framing.SPACE_DELIMITED)
+    LOGGER = async_logging.configure(__name__, arguments.verbose)
+    acquisition.configure_logging(arguments.verbose)
+    broadcast.configure_logging(arguments.verbose)
+    discovery_cache_module.configure_logging(arguments.verbose)
+    handshake.configure_logging(arguments.verbose)
+    runner_module.configure_logging(arguments.verbose)
     return arguments
 
 
-def build_runner(arguments, devices):
+def build_runner(
+        arguments,
+        devices,
+        discovery=None,
+        discovery_cache=None,
+        capture=None,
+        startup_profile=None,
+        event_ring=None):
+    options = dict(
+            event_driven=arguments.event_driven,
+            input_rate=arguments.input_rate,
+            wire_format=arguments.wire_format,
+            prefill_input_cache=arguments.prefill_input_cache,
+            drain_budget=arguments.drain_budget,
+            stale_game_states=arguments.stale_game_states,
+            ping_interval=arguments.ping_interval,
+            instrument=arguments.instrument,
+            handshake_timeout=arguments.handshake_timeout,
+            handshake_retries=arguments.handshake_retries,
+            axis_policy=arguments.axis_policy,
+            button_policy=arguments.button_policy,
+            input_threads=arguments.input_threads,
+            capture=capture,
+            startup_profile=startup_profile,
+            event_ring=event_ring,
+            send_policy=arguments.send_policy,
+            send_high_water_mark=arguments.send_hwm)
     if (arguments.connection):
         commas = arguments.connection.count(',')
         ip, push_port, subscribe_port, replier_port = \
@@ -62,58 +249,158 @@ def build_runner(arguments, devices):
                     ip=ip, port=push_port),
                 subscribe_address="tcp://{ip}:{port}".format(
                     ip=ip, port=subscribe_port),
-                replier_address="tcp://{ip}:{port}".format(
-                    ip=ip, port=replier_port)
-                )
+                reply_address="tcp://{ip}:{port}".format(
+                    ip=ip, port=replier_port),
+                **options)
     else:
-        runner = Runner(devices)
+        runner = Runner(
+                devices,
+                discovery=discovery,
+                discovery_cache=discovery_cache,
+                **options)
     return runner
 
+def build_joysticks(verbose, shaped_curves=False):
+    # pygame is slow to import and initialise, only pay for it if there is a
+    # joystick
+    import pygame
+    from orwell.client import joystick
+    joystick.configure_logging(verbose)
+    pygame.joystick.init()
+    joystick_count = pygame.joystick.get_count()
+    if (0 == joystick_count):
+        pygame.quit()
+        return []
+    if (joystick_count > 1):
+        LOGGER.warning("%d joysticks detected", joystick_count)
+    # the event queue needs the video subsystem, without any window
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    sensivity = 0.05
+    devices = []
+    for i in range(joystick_count):
+        LOGGER.debug("joystick %d start", i)
+        pygame_joystick = pygame.joystick.Joystick(i)
+        LOGGER.debug("joystick %d retrieved", i)
+        joystick_wrapper = joystick.Joystick.get_joystick(
+            pygame_joystick, sensivity, shaped_curves=shaped_curves)
+        LOGGER.debug("joystick %d wrapper found", i)
+        devices.append(joystick_wrapper)
+    return devices
+
+
+def build_keyboard(verbose):
+    from orwell.client import keyboard
+    keyboard.configure_logging(verbose)
+    return keyboard.Keyboard()
+
+
+def quit_pygame():
+    # only if a joystick made us import it
+    if ("pygame" in sys.modules):
+        sys.modules["pygame"].quit()
+
+
 def main():
-    global RUNNER
+    imports_done = monotonic()
     random.seed(None)
     arguments = parse()
+    startup_profile = startup.StartupProfile(
+        arguments.profile_startup, IMPORTS_STARTED)
+    startup_profile.add(startup.IMPORTS, imports_done - IMPORTS_STARTED)
+    discovery = None
+    discovery_cache = None
+    if (not arguments.connection):
+        discovery = Discovery(window=arguments.discovery_window)
+        if (arguments.discovery_cache):
+            discovery_cache = DiscoveryCache(ttl=arguments.discovery_cache_ttl)
+        if ((discovery_cache is None) or (discovery_cache.load() is None)):
+            # look for the server while the devices are initialised
+            discovery.start()
     # done = False
+    started = startup_profile.start()
     devices = []
-    if (arguments.joystick):
-        pygame.init()
-        os.putenv('SDL_VIDEODRIVER', 'dummy')
-        pygame.display.set_mode((1, 1))
-        pygame.display.init()
-        pygame.joystick.init()
-        sensivity = 0.05
-        joystick_count = pygame.joystick.get_count()
-        if (joystick_count > 1):
-            logging.warning("Warning,", joystick_count, " joysticks detected")
-        for i in range(joystick_count):
-            logging.debug("joystick " + str(i) + " start")
-            joystick = pygame.joystick.Joystick(i)
-            logging.debug("joystick " + str(i) + " retrieved")
-            joystick_wrapper = Joystick.get_joystick(joystick, sensivity)
-            logging.debug("joystick " + str(i) + " wrapper found")
-            devices.append(joystick_wrapper)
-        runner = build_runner(arguments, devices)
-        RUNNER = runner
-        runner.run()
-        pygame.quit()
+    if (arguments.replay):
+        devices.append(recording.ReplayDevice(
+            recording.load_recording(arguments.replay),
+            realtime=(not arguments.replay_fast)))
     else:
-        from orwell.client import keyboard
-        keyboard.configure_logging(arguments.verbose)
-        devices.append(keyboard.Keyboard())
-        runner = build_runner(arguments, devices)
-        RUNNER = runner
+        if (arguments.joystick):
+            devices = build_joysticks(
+                arguments.verbose, arguments.shaped_curves)
+        else:
+            devices.append(build_keyboard(arguments.verbose))
+    startup_profile.stop(startup.DEVICE_INIT, started)
+    try:
+        run(arguments, devices, discovery, discovery_cache, startup_profile)
+    finally:
+        quit_pygame()
+
+
+def run(
+        arguments,
+        devices,
+        discovery,
+        discovery_cache,
+        startup_profile=None):
+    global RUNNER, EVENT_RING, EVENT_RING_PATH
+    writer = None
+    if (arguments.record):
+        writer = recording.RecordingWriter(arguments.record)
+        devices = [
+            recording.RecordingDevice(device, writer) for device in devices]
+    capture = None
+    if (arguments.capture):
+        capture = CaptureWriter(arguments.capture)
+    if (arguments.event_ring):
+        EVENT_RING = async_logging.EventRing()
+        EVENT_RING_PATH = arguments.event_ring
+    runner = build_runner(
+        arguments,
+        devices,
+        discovery,
+        discovery_cache,
+        capture,
+        startup_profile,
+        EVENT_RING)
+    RUNNER = runner
+    try:
         runner.run()
+    finally:
+        if (writer):
+            writer.close()
+        if (capture):
+            capture.close()
+        dump_event_ring()
+        async_logging.shutdown()
 
 
 def signal_handler(signal, frame):
-    global RUNNER
-    logging.info('You pressed Ctrl+C!')
+    LOGGER.info('You pressed Ctrl+C!')
     if (RUNNER):
         RUNNER.destroy()
-    # let's hope it does nothing wrong if not initialised
-    pygame.quit()
+    quit_pygame()
     sys.exit(0)
 
+
+def instrumentation_signal_handler(signal, frame):
+    if (RUNNER):
+        LOGGER.info(str(RUNNER.instrumentation))
+
+
+def dump_event_ring():
+    if (EVENT_RING is not None):
+        count = EVENT_RING.dump(EVENT_RING_PATH)
+        LOGGER.info(
+            "%d events dumped to %s", count, EVENT_RING_PATH)
+
+
+def event_ring_signal_handler(signal, frame):
+    dump_event_ring()
+
 if ("__main__" == __name__):
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGUSR1, instrumentation_signal_handler)
+    signal.signal(signal.SIGUSR2, event_ring_signal_handler)
     main()
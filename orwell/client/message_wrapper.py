@@ -1,9 +1,76 @@
+import importlib
+
+# routing id and message type are expected to fit in this many bytes ; only
+# this part of the frame is copied to find the separators
+HEADER_SIZE = 128
+
+# message classes, or (module, class name) for the ones not imported yet:
+# the protobuf modules are only loaded when a message of theirs is parsed
+MESSAGE_TYPES = {
+    "GameState": ("orwell.messages.server_game_pb2", "GameState"),
+    "Welcome": ("orwell.messages.server_game_pb2", "Welcome"),
+    "Goodbye": ("orwell.messages.server_game_pb2", "Goodbye"),
+    "Pong": ("orwell.messages.robot_pb2", "Pong"),
+}
+
+
+def register_message_type(message_type, message_class):
+    MESSAGE_TYPES[message_type] = message_class
+
+
+def get_message_class(message_type):
+    # None for unknown message types
+    message_class = MESSAGE_TYPES.get(message_type)
+    if (isinstance(message_class, tuple)):
+        module_name, class_name = message_class
+        message_class = getattr(
+            importlib.import_module(module_name), class_name)
+        MESSAGE_TYPES[message_type] = message_class
+    return message_class
+
+
+def _to_str(data):
+    return str(data.decode("ascii"))
+
+
 class MessageWrapper(object):
     def __init__(self, message):
-        recipient, message_type, payload = message.split(' ', 2)
+        # message can be a string or a zmq.Frame received with copy=False
+        view = memoryview(message)
+        header = view[:HEADER_SIZE].tobytes()
+        first_space = header.find(b" ")
+        second_space = header.find(b" ", first_space + 1)
+        if ((first_space < 0) or (second_space < 0)):
+            # very long header ; fall back to copying the whole message
+            header = view.tobytes()
+            first_space = header.find(b" ")
+            second_space = header.find(b" ", first_space + 1)
+            if ((first_space < 0) or (second_space < 0)):
+                raise ValueError("Malformed message: " + repr(header))
+        self._initialise(
+            _to_str(header[:first_space]),
+            _to_str(header[first_space + 1:second_space]),
+            view[second_space + 1:],
+            False)
+
+    @classmethod
+    def from_frames(cls, recipient, message_type, payload):
+        # each part travelled in its own frame so nothing needs to be split
+        wrapper = cls.__new__(cls)
+        wrapper._initialise(
+            _to_str(memoryview(recipient).tobytes()),
+            _to_str(memoryview(message_type).tobytes()),
+            memoryview(payload),
+            True)
+        return wrapper
+
+    def _initialise(self, recipient, message_type, payload_view, multipart):
         self._recipient = recipient
         self._message_type = message_type
-        self._payload = payload
+        self._payload_view = payload_view
+        self._multipart = multipart
+        self._payload = None
+        self._message = None
 
     @property
     def recipient(self):
@@ -13,10 +80,32 @@ class MessageWrapper(object):
     def message_type(self):
         return self._message_type
 
+    @property
+    def multipart(self):
+        return self._multipart
+
+    @property
+    def payload_view(self):
+        return self._payload_view
+
     @property
     def payload(self):
+        if (self._payload is None):
+            self._payload = self._payload_view.tobytes()
         return self._payload
 
+    @property
+    def message(self):
+        # the payload is only parsed the first time it is needed
+        if (self._message is None):
+            message_class = get_message_class(self._message_type)
+            if (message_class is None):
+                raise KeyError("Unknown message type: " + self._message_type)
+            message = message_class()
+            message.ParseFromString(self.payload)
+            self._message = message
+        return self._message
+
     def __str__(self):
         return "(message, recipient = " + self._recipient + \
             "; message_type = " + self._message_type + ")"
@@ -0,0 +1,235 @@
+from __future__ import division
+import math
+
+try:
+    import numpy
+except ImportError:
+    # only needed by the batch mode
+    numpy = None
+
+
+def _clamp(value):
+    return max(-1.0, min(1.0, value))
+
+
+# Shape applied to one axis before mixing: values below dead_zone give 0,
+# values above saturation give +/-1 and expo bends what is in between
+# (0 is linear, 1 is cubic).
+class ResponseCurve(object):
+    def __init__(self, dead_zone=0.0, expo=0.0, saturation=1.0):
+        assert(0 <= dead_zone < saturation <= 1)
+        assert(0 <= expo <= 1)
+        self._dead_zone = dead_zone
+        self._expo = expo
+        self._saturation = saturation
+
+    @property
+    def dead_zone(self):
+        return self._dead_zone
+
+    @property
+    def expo(self):
+        return self._expo
+
+    @property
+    def saturation(self):
+        return self._saturation
+
+    @property
+    def linear(self):
+        # the identity on [-1, 1]
+        return ((0 == self._dead_zone) and (0 == self._expo) and
+                (1 == self._saturation))
+
+    def __call__(self, value):
+        magnitude = math.fabs(value)
+        if (magnitude <= self._dead_zone):
+            return 0.0
+        magnitude = min(
+            1.0,
+            (magnitude - self._dead_zone) /
+            (self._saturation - self._dead_zone))
+        magnitude = (
+            (1 - self._expo) * magnitude + self._expo * magnitude ** 3)
+        return math.copysign(magnitude, value)
+
+    def __repr__(self):
+        return "ResponseCurve(dead_zone=" + repr(self._dead_zone) + \
+            ", expo=" + repr(self._expo) + \
+            ", saturation=" + repr(self._saturation) + ")"
+
+
+LINEAR = ResponseCurve()
+
+
+# Values of a function of [-1, 1] sampled every 1 / resolution ; looking up a
+# value costs an index computation instead of calling the function.
+class LookupTable(object):
+    def __init__(self, function, resolution):
+        self._resolution = resolution
+        self._values = [
+            function(index / resolution - 1.0)
+            for index in range(2 * resolution + 1)]
+        if (numpy is not None):
+            self._array = numpy.array(self._values)
+        else:
+            self._array = None
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def array(self):
+        return self._array
+
+    def index(self, value):
+        return int(round((_clamp(value) + 1.0) * self._resolution))
+
+    def __getitem__(self, value):
+        return self._values[self.index(value)]
+
+    def indices(self, values):
+        return numpy.rint(
+            (numpy.clip(values, -1.0, 1.0) + 1.0) *
+            self._resolution).astype(numpy.intp)
+
+    def lookup(self, values):
+        return self._array[self.indices(values)]
+
+
+def _build_table(curve, resolution):
+    # None for linear curves, applied as they are
+    if (curve.linear):
+        return None
+    return LookupTable(curve, resolution)
+
+
+# Tank mixing of the stick position (x, y) into the speeds of the left and
+# right tracks, quantized with precision, values below dead_zone giving 0.
+# The shaped curves of the axes are precomputed in tables, the rotation
+# coefficients are kept divided by the scale and the quantized outputs (dead
+# zone and clamping applied) are read from a table of levels. Samples whose
+# quantization is too close to a step to trust the shortened computation go
+# through the original formula so that the result is always the same.
+class MixingEngine(object):
+    # distance to a step (in precision units) below which the original
+    # formula is used
+    STEP_MARGIN = 1e-6
+
+    def __init__(
+            self,
+            angle=math.pi * 0.25,
+            precision=0.025,
+            dead_zone=0.0,
+            x_curve=LINEAR,
+            y_curve=LINEAR,
+            factor_curve=LINEAR,
+            resolution=512):
+        self._precision = float(precision)
+        self._dead_zone = dead_zone
+        self._x_table = _build_table(x_curve, resolution)
+        self._y_table = _build_table(y_curve, resolution)
+        self._factor_table = _build_table(factor_curve, resolution)
+        self._angle = None
+        self.angle = angle
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, angle):
+        if (angle == self._angle):
+            return
+        self._angle = angle
+        self._cosine = math.cos(angle)
+        self._sine = math.sin(angle)
+        self._scale = (self._cosine + self._sine) * 0.5
+        self._scaled_cosine = self._cosine / self._scale / self._precision
+        self._scaled_sine = self._sine / self._scale / self._precision
+        # quantized outputs of every step reachable with inputs in [-1, 1]
+        self._steps = int(
+            math.fabs(self._scaled_cosine) + math.fabs(self._scaled_sine)) + 1
+        self._levels = [
+            self._level(step)
+            for step in range(-self._steps, self._steps + 1)]
+
+    def _level(self, step):
+        # what _quantize gives when int(value / precision) is step
+        value = step * self._precision
+        if (math.fabs(value) < self._dead_zone):
+            value = 0
+        return _clamp(value)
+
+    def _quantize(self, value):
+        new_value = int(value / self._precision) * self._precision
+        if (math.fabs(new_value) < self._dead_zone):
+            new_value = 0
+        return new_value
+
+    def _exact(self, x, y, factor):
+        cosine = self._cosine
+        sine = self._sine
+        # same operations in the same order as the original formula so
+        # that the rounding is the same
+        left = self._quantize(factor * (x * cosine + y * sine) / self._scale)
+        right = self._quantize(factor * (y * cosine - x * sine) / self._scale)
+        return _clamp(left), _clamp(right)
+
+    def mix(self, x, y, factor):
+        if (self._x_table is not None):
+            x = self._x_table[x]
+        if (self._y_table is not None):
+            y = self._y_table[y]
+        if (self._factor_table is not None):
+            factor = self._factor_table[factor]
+        cosine = self._scaled_cosine
+        sine = self._scaled_sine
+        # outputs in precision units
+        left = factor * (x * cosine + y * sine)
+        right = factor * (y * cosine - x * sine)
+        left_step = int(left)
+        right_step = int(right)
+        margin = MixingEngine.STEP_MARGIN
+        steps = self._steps
+        if ((margin < abs(left - left_step) < 1 - margin) and
+                (margin < abs(right - right_step) < 1 - margin) and
+                (-steps < left_step < steps) and
+                (-steps < right_step < steps)):
+            levels = self._levels
+            return levels[left_step + steps], levels[right_step + steps]
+        return self._exact(x, y, factor)
+
+    def _quantize_array(self, values):
+        # numpy.trunc rounds towards 0 like int()
+        values = numpy.trunc(values / self._precision) * self._precision
+        values[numpy.fabs(values) < self._dead_zone] = 0
+        return numpy.clip(values, -1.0, 1.0)
+
+    def mix_batch(self, xs, ys, factors):
+        # returns the left and right values of whole sequences of samples,
+        # as numpy arrays if numpy is available
+        if (numpy is None):
+            mixed = [self.mix(*sample) for sample in zip(xs, ys, factors)]
+            return [left for left, _ in mixed], [right for _, right in mixed]
+        xs = numpy.asarray(xs, dtype=float)
+        ys = numpy.asarray(ys, dtype=float)
+        factors = numpy.asarray(factors, dtype=float)
+        if (self._x_table is not None):
+            xs = self._x_table.lookup(xs)
+        if (self._y_table is not None):
+            ys = self._y_table.lookup(ys)
+        if (self._factor_table is not None):
+            factors = self._factor_table.lookup(factors)
+        cosine = self._cosine
+        sine = self._sine
+        return (
+            self._quantize_array(
+                factors * (xs * cosine + ys * sine) / self._scale),
+            self._quantize_array(
+                factors * (ys * cosine - xs * sine) / self._scale))
@@ -0,0 +1,173 @@
+import collections
+
+import zmq
+
+from orwell.client.clock import monotonic
+
+# blocking sends, the loop waits for the server (previous behaviour)
+BLOCK = "block"
+# non blocking sends: while the socket is full only the newest input is
+# kept, the older ones are dropped
+DROP_OLDEST = "drop_oldest"
+# like DROP_OLDEST but inputs changing the buttons are queued and always
+# delivered, in order
+DELIVER_BUTTONS = "deliver_buttons"
+SEND_POLICIES = (BLOCK, DROP_OLDEST, DELIVER_BUTTONS)
+
+
+# Sends inputs and pings on the PUSH socket without letting a slow server
+# freeze the loop. Inputs are only framed when they are actually sent (with
+# frame_input, returning the framing and the framed message) so that the
+# ones held back follow a change of routing id or wire format.
+class PushSender(object):
+    # how long to wait before trying again when the socket is full
+    RETRY_INTERVAL = 0.005
+
+    def __init__(
+            self,
+            socket,
+            frame_input,
+            policy=BLOCK,
+            high_water_mark=None):
+        assert(policy in SEND_POLICIES)
+        if (high_water_mark is not None):
+            # only applies to connections made after this
+            socket.setsockopt(zmq.SNDHWM, high_water_mark)
+        self._socket = socket
+        self._frame_input = frame_input
+        self._policy = policy
+        if (BLOCK == policy):
+            self._flags = 0
+        else:
+            self._flags = zmq.NOBLOCK
+        self._buttons = collections.deque()
+        self._latest = None
+        self._last_buttons = None
+        self._retry_at = None
+        self._blocked_since = None
+        self._sent = 0
+        self._queued = 0
+        self._dropped = 0
+        self._dropped_pings = 0
+        self._blocked_time = 0.0
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def sent(self):
+        return self._sent
+
+    @property
+    def queued(self):
+        # inputs that could not be sent at once
+        return self._queued
+
+    @property
+    def dropped(self):
+        # inputs replaced by a newer one before they could be sent
+        return self._dropped
+
+    @property
+    def dropped_pings(self):
+        return self._dropped_pings
+
+    @property
+    def blocked_time(self):
+        # time spent in blocking sends (BLOCK) or with inputs held back
+        return self._blocked_time
+
+    @property
+    def pending(self):
+        return (len(self._buttons) + (self._latest is not None))
+
+    @property
+    def next_deadline(self):
+        if (not self.pending):
+            return None
+        return self._retry_at
+
+    def send_input(self, input_, now=None):
+        buttons = (input_.fire_weapon1, input_.fire_weapon2)
+        edge = ((DELIVER_BUTTONS == self._policy) and
+                (buttons != self._last_buttons))
+        self._last_buttons = buttons
+        if (self.pending):
+            # behind the inputs already waiting
+            self._hold(input_, edge, now)
+            self.flush(now)
+        elif (not self._try_send(input_)):
+            self._hold(input_, edge, now)
+
+    def send(self, framing, routing_id, message_type, payload):
+        # for messages that can be lost (pings)
+        try:
+            framing.send(
+                self._socket, routing_id, message_type, payload, self._flags)
+        except zmq.Again:
+            self._dropped_pings += 1
+            return False
+        return True
+
+    def flush(self, now=None):
+        if (not self.pending):
+            return
+        if (now is None):
+            now = monotonic()
+        while (self._buttons):
+            if (not self._try_send(self._buttons[0])):
+                self._retry_at = now + PushSender.RETRY_INTERVAL
+                return
+            self._buttons.popleft()
+        if (self._latest is not None):
+            if (not self._try_send(self._latest)):
+                self._retry_at = now + PushSender.RETRY_INTERVAL
+                return
+            self._latest = None
+        self._blocked_time += now - self._blocked_since
+        self._blocked_since = None
+
+    def tick(self, now=None):
+        if ((self.pending) and
+                ((now or monotonic()) >= self._retry_at)):
+            self.flush(now)
+
+    def _hold(self, input_, edge, now):
+        if (now is None):
+            now = monotonic()
+        self._queued += 1
+        if (self._latest is not None):
+            # the newer input carries the newest values
+            self._dropped += 1
+            self._latest = None
+        if (edge):
+            self._buttons.append(input_)
+        else:
+            self._latest = input_
+        if (self._blocked_since is None):
+            self._blocked_since = now
+        self._retry_at = now + PushSender.RETRY_INTERVAL
+
+    def _try_send(self, input_):
+        framing, framed = self._frame_input(input_)
+        if (BLOCK == self._policy):
+            started = monotonic()
+            framing.send_framed(self._socket, framed)
+            self._blocked_time += monotonic() - started
+        else:
+            try:
+                framing.send_framed(self._socket, framed, self._flags)
+            except zmq.Again:
+                return False
+        self._sent += 1
+        return True
+
+    def __str__(self):
+        return "(push sender, policy = " + self._policy + \
+            "; sent = " + str(self._sent) + \
+            "; queued = " + str(self._queued) + \
+            "; dropped = " + str(self._dropped) + \
+            "; dropped pings = " + str(self._dropped_pings) + \
+            "; pending = " + str(self.pending) + \
+            "; blocked = {0:.3f} s)".format(self._blocked_time)
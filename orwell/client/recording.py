@@ -0,0 +1,327 @@
+import array
+import collections
+import struct
+import sys
+
+from orwell.client.clock import monotonic
+from orwell.client.device import Device
+from orwell.client.input import Input
+
+MAGIC = b"ORWREC"
+VERSION = 1
+# magic, version, byte order of the columns (0 little, 1 big)
+HEADER = struct.Struct("<6sBB")
+BLOCK_HEADER = struct.Struct("<I")
+# left and right are stored as integers, exact for the precisions used by the
+# devices (multiples of 0.0001)
+SCALE = 10000
+FIRE_WEAPON1 = 1
+FIRE_WEAPON2 = 2
+PING = 4
+# (typecode, name) of the columns, written one after the other in each block
+COLUMNS = (("d", "offsets"), ("h", "lefts"), ("h", "rights"), ("B", "flags"))
+
+
+def _native_order():
+    return 0 if ("little" == sys.byteorder) else 1
+
+
+def _to_bytes(column):
+    if (hasattr(column, "tobytes")):
+        return column.tobytes()
+    return column.tostring()
+
+
+def _extend(column, data):
+    if (hasattr(column, "frombytes")):
+        column.frombytes(data)
+    else:
+        column.fromstring(data)
+
+
+# Samples kept column by column in arrays: offset (in seconds since the first
+# sample), left, right and flags (fire_weapon1, fire_weapon2, ping).
+class Recording(object):
+    def __init__(self):
+        self.offsets = array.array("d")
+        self.lefts = array.array("h")
+        self.rights = array.array("h")
+        self.flags = array.array("B")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, offset, left, right, fire_weapon1, fire_weapon2, ping):
+        flags = 0
+        if (fire_weapon1):
+            flags |= FIRE_WEAPON1
+        if (fire_weapon2):
+            flags |= FIRE_WEAPON2
+        if (ping):
+            flags |= PING
+        self.offsets.append(offset)
+        self.lefts.append(int(round(left * SCALE)))
+        self.rights.append(int(round(right * SCALE)))
+        self.flags.append(flags)
+
+    def __getitem__(self, index):
+        # (offset, left, right, fire_weapon1, fire_weapon2, ping)
+        flags = self.flags[index]
+        return (
+            self.offsets[index],
+            self.lefts[index] / float(SCALE),
+            self.rights[index] / float(SCALE),
+            bool(flags & FIRE_WEAPON1),
+            bool(flags & FIRE_WEAPON2),
+            bool(flags & PING))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def duration(self):
+        if (not self.offsets):
+            return 0.0
+        return self.offsets[-1]
+
+    def clear(self):
+        for _, name in COLUMNS:
+            del getattr(self, name)[:]
+
+    def to_samples(self):
+        # in the format of ScriptedDevice
+        return [sample[1:] for sample in self]
+
+
+def load_recording(path):
+    recording = Recording()
+    with open(path, "rb") as recording_file:
+        magic, version, byte_order = HEADER.unpack(
+            recording_file.read(HEADER.size))
+        if ((MAGIC != magic) or (VERSION != version)):
+            raise ValueError(path + " is not a recording")
+        swap = (byte_order != _native_order())
+        while True:
+            data = recording_file.read(BLOCK_HEADER.size)
+            if (not data):
+                break
+            count, = BLOCK_HEADER.unpack(data)
+            for typecode, name in COLUMNS:
+                column = array.array(typecode)
+                size = count * column.itemsize
+                data = recording_file.read(size)
+                if (len(data) != size):
+                    raise ValueError(path + " is truncated")
+                _extend(column, data)
+                if (swap):
+                    column.byteswap()
+                getattr(recording, name).extend(column)
+    return recording
+
+
+# Appends samples to a recording file, in blocks of block_size samples so that
+# a crash only loses the last block.
+class RecordingWriter(object):
+    def __init__(self, path, block_size=1024):
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, _native_order()))
+        self._block_size = block_size
+        self._block = Recording()
+        self._started = None
+        self._count = 0
+
+    @property
+    def count(self):
+        return self._count
+
+    def append(
+            self,
+            left,
+            right,
+            fire_weapon1,
+            fire_weapon2,
+            ping,
+            timestamp=None):
+        if (timestamp is None):
+            timestamp = monotonic()
+        if (self._started is None):
+            self._started = timestamp
+        self._block.append(
+            timestamp - self._started,
+            left,
+            right,
+            fire_weapon1,
+            fire_weapon2,
+            ping)
+        self._count += 1
+        if (len(self._block) >= self._block_size):
+            self.flush()
+
+    def flush(self):
+        if (not len(self._block)):
+            return
+        self._file.write(BLOCK_HEADER.pack(len(self._block)))
+        for _, name in COLUMNS:
+            self._file.write(_to_bytes(getattr(self._block, name)))
+        self._file.flush()
+        self._block.clear()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Records what a device produces, the device being used as usual through this
+# wrapper.
+class RecordingDevice(Device):
+    def __init__(self, device, writer):
+        self._device = device
+        self._writer = writer
+        self._input = None
+        self._ping = False
+
+    @property
+    def device(self):
+        return self._device
+
+    def process(self):
+        device = self._device
+        device.process()
+        if (device.has_new_values):
+            self._input = device.build_input()
+        ping = device.read_ping()
+        if (ping):
+            self._ping = True
+        if ((device.has_new_values) or (ping)):
+            input_ = self._input
+            if (input_ is None):
+                # a ping before any value
+                self._writer.append(0.0, 0.0, False, False, ping)
+            else:
+                self._writer.append(
+                    input_.left,
+                    input_.right,
+                    input_.fire_weapon1,
+                    input_.fire_weapon2,
+                    ping)
+
+    @property
+    def has_new_values(self):
+        return self._device.has_new_values
+
+    def build_input(self):
+        return self._input
+
+    def read_ping(self):
+        if (self._ping):
+            self._ping = False
+            return True
+        else:
+            return False
+
+    @property
+    def poll_sources(self):
+        return self._device.poll_sources
+
+    @property
+    def poll_interval(self):
+        return self._device.poll_interval
+
+
+# Plays a recording back. In real time the samples are released when their
+# offset is reached (several samples due at once only give the last values);
+# otherwise one sample is played per call to process(), which makes the
+# replay deterministic whatever the speed of the loop.
+class ReplayDevice(Device):
+    MAX_TIMESTAMPS = 100000
+
+    def __init__(
+            self,
+            recording,
+            realtime=True,
+            loop=False,
+            keep_timestamps=False):
+        assert(len(recording))
+        self._recording = recording
+        self._realtime = realtime
+        self._loop = loop
+        self._index = 0
+        self._started = None
+        self._current = None
+        self._has_new_values = False
+        self._ping = False
+        self._keep_timestamps = keep_timestamps
+        # only the most recent ones, a long run must not grow without bound
+        self._timestamps = collections.deque(
+            maxlen=ReplayDevice.MAX_TIMESTAMPS)
+
+    @property
+    def timestamps(self):
+        return self._timestamps
+
+    @property
+    def finished(self):
+        return ((not self._loop) and (self._index >= len(self._recording)))
+
+    def process(self):
+        self._has_new_values = False
+        if (self._index >= len(self._recording)):
+            if (not self._loop):
+                return
+            self._index = 0
+            self._started = None
+        now = monotonic()
+        if (self._started is None):
+            self._started = now
+        if (self._realtime):
+            elapsed = now - self._started
+            offsets = self._recording.offsets
+            while ((self._index < len(offsets)) and
+                    (offsets[self._index] <= elapsed)):
+                self._play(self._recording[self._index])
+        else:
+            self._play(self._recording[self._index])
+        if ((self._has_new_values) and (self._keep_timestamps)):
+            self._timestamps.append((now, self._current))
+
+    def _play(self, sample):
+        _, left, right, fire_weapon1, fire_weapon2, ping = sample
+        self._index += 1
+        values = (left, right, fire_weapon1, fire_weapon2)
+        if (self._current != values):
+            self._has_new_values = True
+            self._current = values
+        if (ping):
+            self._ping = True
+
+    @property
+    def has_new_values(self):
+        return self._has_new_values
+
+    @property
+    def poll_interval(self):
+        if ((not self._realtime) or (self._started is None)):
+            return 0
+        if (self._index >= len(self._recording)):
+            return 0 if self._loop else None
+        return max(
+            0,
+            self._recording.offsets[self._index] -
+            (monotonic() - self._started))
+
+    def build_input(self):
+        return Input(*self._current)
+
+    def read_ping(self):
+        if (self._ping):
+            self._ping = False
+            return True
+        else:
+            return False
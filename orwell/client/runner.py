@@ -1,176 +1,589 @@
-import logging
 import random
 import time
 
 import zmq
 
-import orwell.messages.controller_pb2 as pb_controller
-import orwell.messages.server_game_pb2 as pb_server_game
-import orwell.messages.robot_pb2 as pb_robot
-
-from orwell.client.broadcast import Broadcast
-from orwell.client.message_wrapper import MessageWrapper
+from orwell.client.acquisition import AcquisitionPool
+from orwell.client import async_logging
+from orwell.client.broadcast import Discovery
+from orwell.client.clock import monotonic
+from orwell.client import framing
+from orwell.client import game_state_store
+from orwell.client.handshake import Handshake
+from orwell.client.handshake import HandshakeError
+from orwell.client.input import InputCache
+from orwell.client import input_aggregator
+from orwell.client.input_scheduler import InputScheduler
+from orwell.client import instrumentation
+from orwell.client.latency import LatencyMonitor
+from orwell.client.loop_statistics import DrainStatistics
+from orwell.client.loop_statistics import LoopStatistics
+from orwell.client import push_sender
+from orwell.client import startup
 
 NAME = "client"
 LOGGER = None
 
+# what to do with GameState messages that are already outdated by a newer
+# one waiting in the SUB socket
+KEEP_GAME_STATES = "keep"
+# only handle the newest GameState of each drained batch
+DROP_STALE_GAME_STATES = "drop"
+# let zmq keep only the last message (ZMQ_CONFLATE) ; this applies to all
+# messages, including Pong, and does not work with multipart messages so it
+# is only accepted with the space delimited wire format
+CONFLATE_GAME_STATES = "conflate"
+STALE_GAME_STATE_POLICIES = (
+    KEEP_GAME_STATES, DROP_STALE_GAME_STATES, CONFLATE_GAME_STATES)
+
 
 class Runner(object):
     STATE_INIT = "STATE_INIT"
     STATE_WELCOME = "STATE_WELCOME"
     STATE_WAITING_GAME_START = "STATE_WAITING_GAME_START"
     STATE_GAME_RUNNING = "STATE_GAME_RUNNING"
+    # used in the dispatch table for messages handled whatever the state
+    ANY_STATE = None
+
+    DISPATCH = {
+        (ANY_STATE, "Pong"): "_decode_pong",
+        (STATE_WELCOME, "GameState"): "_decode_game_state_init",
+        (STATE_WAITING_GAME_START, "GameState"): "_decode_game_state_start",
+        (STATE_GAME_RUNNING, "GameState"): "_decode_game_state_running",
+    }
 
     def __init__(
             self,
             devices,
             push_address=None,
             subscribe_address=None,
-            reply_address=None):
+            reply_address=None,
+            event_driven=False,
+            poll_timeout=1.0,
+            report_interval=10.0,
+            input_rate=None,
+            wire_format=framing.SPACE_DELIMITED,
+            input_precision=0.025,
+            prefill_input_cache=False,
+            drain_budget=100,
+            stale_game_states=KEEP_GAME_STATES,
+            ping_interval=None,
+            max_pings_in_flight=8,
+            instrument=False,
+            context=None,
+            discovery=None,
+            discovery_cache=None,
+            cached_handshake_timeout=0.5,
+            handshake_timeout=2.5,
+            handshake_retries=3,
+            axis_policy=input_aggregator.OVERRIDE,
+            button_policy=input_aggregator.OR,
+            input_threads=0,
+            capture=None,
+            startup_profile=None,
+            event_ring=None,
+            send_policy=push_sender.BLOCK,
+            send_high_water_mark=None):
+        if ((CONFLATE_GAME_STATES == stale_game_states) and
+                (framing.SPACE_DELIMITED != wire_format)):
+            # ZMQ_CONFLATE would keep a single frame of multipart messages
+            raise ValueError(
+                "conflating the GameState messages needs the " +
+                framing.SPACE_DELIMITED + " wire format, not " + wire_format)
+        if (startup_profile is None):
+            startup_profile = startup.StartupProfile()
+        self._startup_profile = startup_profile
+        # EventRing tracing what the loop does, None to disable
+        self._event_ring = event_ring
+        if (event_ring is not None):
+            self._input_event = event_ring.register("input")
+            self._ping_event = event_ring.register("ping")
+            self._receive_events = {}
+        if (input_threads):
+            # the devices are read on their own threads, the loop only gets
+            # the newest samples
+            self._acquisition = AcquisitionPool(devices, input_threads)
+            devices = self._acquisition.devices
+        else:
+            self._acquisition = None
         self._devices = devices
+        # CaptureWriter receiving the raw frames of the SUB socket
+        self._capture = capture
+        self._input_aggregator = input_aggregator.InputAggregator(
+                len(devices), axis_policy, button_policy)
+        self._discovery_cache = discovery_cache
+        self._cached_handshake_timeout = cached_handshake_timeout
+        cached_addresses = None
         if ((push_address is None) or (subscribe_address is None)):
-            broadcast = Broadcast()
-            LOGGER.info(
-                    broadcast.push_address +
-                    " / " + broadcast.subscribe_address +
-                    " / " + broadcast.reply_address)
-            self._push_address = broadcast.push_address
-            self._subscribe_address = broadcast.subscribe_address
-            self._reply_address = broadcast.reply_address
+            if (discovery_cache is not None):
+                cached_addresses = discovery_cache.load()
+            if (discovery is None):
+                discovery = Discovery()
+            if (cached_addresses is None):
+                # discovery runs in the background while the rest is set up
+                discovery.start()
+        else:
+            discovery = None
+        self._discovery = discovery
+        self._from_cache = (cached_addresses is not None)
+        self._wire_format = wire_format
+        self._framing = framing.build_framing(wire_format)
+        if (input_rate):
+            self._input_scheduler = InputScheduler(self._send_input, input_rate)
         else:
-            self._push_address = push_address
-            self._subscribe_address = subscribe_address
-            self._reply_address = reply_address
-        self._context = zmq.Context.instance()
+            self._input_scheduler = None
+        self._event_driven = event_driven
+        self._poll_timeout = poll_timeout
+        self._report_interval = report_interval
+        self._loop_statistics = LoopStatistics()
+        assert(stale_game_states in STALE_GAME_STATE_POLICIES)
+        self._drain_budget = drain_budget
+        self._drop_stale_game_states = (
+            DROP_STALE_GAME_STATES == stale_game_states)
+        self._drain_statistics = DrainStatistics()
+        self._latency_monitor = LatencyMonitor(
+                self._send_ping,
+                NAME,
+                interval=ping_interval,
+                max_in_flight=max_pings_in_flight)
+        self._game_state_store = game_state_store.GameStateStore()
+        self._game_state_store.subscribe(
+                game_state_store.PLAYING, self._log_playing)
+        self._game_state_store.subscribe(
+                game_state_store.SECONDS, self._log_seconds)
+        self._game_state_store.subscribe(
+                game_state_store.SCORES, self._log_scores)
+        self._game_state_store.subscribe(
+                game_state_store.TEAMS, self._log_teams)
+        handler_names = sorted(set(Runner.DISPATCH.values()))
+        self._instrumentation = instrumentation.Instrumentation(
+                [
+                    instrumentation.DEVICE_PROCESS,
+                    instrumentation.BUILD_INPUT,
+                    instrumentation.SERIALIZE,
+                    instrumentation.SEND,
+                    instrumentation.RECEIVE,
+                ] + handler_names,
+                enabled=instrument)
+        self._device_process_stage = self._instrumentation.index(
+                instrumentation.DEVICE_PROCESS)
+        self._build_input_stage = self._instrumentation.index(
+                instrumentation.BUILD_INPUT)
+        self._serialize_stage = self._instrumentation.index(
+                instrumentation.SERIALIZE)
+        self._send_stage = self._instrumentation.index(instrumentation.SEND)
+        self._receive_stage = self._instrumentation.index(
+                instrumentation.RECEIVE)
+        self._handlers = dict(
+            (key, (getattr(self, name), self._instrumentation.index(name)))
+            for key, name in Runner.DISPATCH.items())
+        # a context given by the caller may be shared with other runners
+        self._owns_context = (context is None)
+        if (context is None):
+            context = zmq.Context.instance()
+        self._context = context
+        self._handshake_time = None
         self._push_socket = self._context.socket(zmq.PUSH)
         self._push_socket.setsockopt(zmq.LINGER, 0)
-        self._push_socket.connect(self._push_address)
+        # sets the high water mark before the socket is connected
+        self._push_sender = push_sender.PushSender(
+                self._push_socket,
+                self._frame_input,
+                send_policy,
+                send_high_water_mark)
         self._subscribe_socket = self._context.socket(zmq.SUB)
         self._subscribe_socket.setsockopt(zmq.LINGER, 0)
-        self._subscribe_socket.connect(self._subscribe_address)
-        self._reply_socket = self._context.socket(zmq.REQ)
-        self._reply_socket.setsockopt(zmq.LINGER, 0)
-        self._reply_socket.connect(self._reply_address)
+        if (CONFLATE_GAME_STATES == stale_game_states):
+            self._subscribe_socket.setsockopt(zmq.CONFLATE, 1)
+        self._handshake = Handshake(
+                self._context, handshake_timeout, handshake_retries)
+        # value of ready in the Hello waiting for its reply
+        self._hello_ready = False
         self._routing_id = "temporary_id_" + str(random.randint(0, 32768))
         # at first we are only interested to messages specific to this client
         self._subscribe_socket.setsockopt(zmq.SUBSCRIBE, self._routing_id)
+        if (cached_addresses is not None):
+            LOGGER.info("try cached addresses first")
+            push_address, subscribe_address, reply_address = cached_addresses
+        self._push_address = None
+        self._subscribe_address = None
+        self._reply_address = None
+        if ((cached_addresses is not None) or (discovery is None)):
+            self._connect(push_address, subscribe_address, reply_address)
+        # otherwise the sockets are connected by start() once discovery is
+        # done, it keeps running while the rest is set up
+        self._input_cache = InputCache(
+                self._framing, self._routing_id, input_precision)
+        self._prefill_input_cache = prefill_input_cache
         self._robot = None
         self._team = None
         self._abort = False
         self._state = Runner.STATE_INIT
-        self._ping = False
 
     def destroy(self):
-        self._push_socket.disconnect(self._push_address)
+        if (self._acquisition):
+            self._acquisition.close()
+        if (self._push_address is not None):
+            self._push_socket.disconnect(self._push_address)
+            self._subscribe_socket.disconnect(self._subscribe_address)
         self._push_socket.close()
-        self._subscribe_socket.disconnect(self._subscribe_address)
         self._subscribe_socket.close()
-        self._context.destroy()
+        if (self._owns_context):
+            self._context.destroy()
+        else:
+            self._handshake.close()
+
+    def stop(self):
+        # the main loop exits at the end of the current iteration
+        self._abort = True
+
+    def _connect(self, push_address, subscribe_address, reply_address):
+        started = self._startup_profile.start()
+        self._push_address = push_address
+        self._subscribe_address = subscribe_address
+        self._reply_address = reply_address
+        self._push_socket.connect(self._push_address)
+        self._subscribe_socket.connect(self._subscribe_address)
+        self._handshake.connect(self._reply_address)
+        self._startup_profile.stop(startup.CONNECT, started)
+
+    def _discover(self):
+        started = self._startup_profile.start()
+        self._discovery.start()
+        addresses = self._discovery.result()
+        self._startup_profile.stop(startup.DISCOVERY, started)
+        LOGGER.info(" / ".join(addresses))
+        if (self._discovery_cache is not None):
+            self._discovery_cache.save(addresses)
+        return addresses
+
+    def _fall_back_to_discovery(self):
+        LOGGER.info("cached addresses did not answer, fall back to discovery")
+        self._discovery_cache.clear()
+        self._from_cache = False
+        # still connected to the cached addresses if discovery fails, so
+        # that destroy() has something to disconnect
+        addresses = self._discover()
+        self._push_socket.disconnect(self._push_address)
+        self._subscribe_socket.disconnect(self._subscribe_address)
+        self._connect(*addresses)
 
     def start(self):
         assert(Runner.STATE_INIT == self._state)
-        self._hello_and_reply(False)
+        if (self._push_address is None):
+            self._connect(*self._discover())
+        started = monotonic()
+        if (self._from_cache):
+            self._send_hello(False, self._cached_handshake_timeout, 0)
+            if (self._wait_for_handshake()):
+                # the server is still there, keep the cache fresh
+                self._discovery_cache.save((
+                    self._push_address,
+                    self._subscribe_address,
+                    self._reply_address))
+            else:
+                self._fall_back_to_discovery()
+                self._send_hello(False)
+                self._wait_for_handshake()
+        else:
+            self._send_hello(False)
+            self._wait_for_handshake()
+        if (self._handshake.failed):
+            raise HandshakeError(
+                "no Welcome from " + str(self._reply_address))
+        self._handshake_time = monotonic() - started
+
+    @property
+    def handshake_time(self):
+        return self._handshake_time
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        # only meant to replay captures without handshake
+        self._state = state
+
+    @property
+    def handshake(self):
+        return self._handshake
+
+    @property
+    def loop_statistics(self):
+        return self._loop_statistics
+
+    @property
+    def input_scheduler(self):
+        return self._input_scheduler
+
+    @property
+    def input_aggregator(self):
+        return self._input_aggregator
+
+    @property
+    def input_cache(self):
+        return self._input_cache
+
+    @property
+    def push_sender(self):
+        return self._push_sender
+
+    @property
+    def drain_statistics(self):
+        return self._drain_statistics
+
+    @property
+    def game_state_store(self):
+        return self._game_state_store
+
+    @property
+    def latency_monitor(self):
+        return self._latency_monitor
+
+    @property
+    def instrumentation(self):
+        return self._instrumentation
 
     def run(self):
         self.start()
+        if (self._startup_profile.enabled):
+            self._startup_profile.finish()
+            LOGGER.info(str(self._startup_profile))
+        if (self._acquisition):
+            self._acquisition.start()
+        try:
+            if (self._event_driven):
+                self._run_event_driven()
+            else:
+                self._run_busy()
+        finally:
+            if (self._acquisition):
+                self._acquisition.stop()
+
+    def _run_busy(self):
         k = 0
         while not self._abort:
             if (0 == k % 100000):
-                print(k)
+                LOGGER.debug("busy loop: %d iterations", k)
             k += 1
-            for device in self._devices:
-                device.process()
-
-                if (Runner.STATE_GAME_RUNNING == self._state):
-                    if (device.has_new_values):
-                        msg = device.build_input().get_message(self._routing_id)
-                        self._push_socket.send(msg)
-                if (not self._ping):
-                    if (device.read_ping()):
-                        self._send_ping()
-            self.process()
-
-    def _send_ping(self):
-        self._ping = True
-        pb_ping = pb_controller.Ping()
-        timing_event = pb_ping.timing.add()
-        timing_event.logger = NAME
-        timestamp = int(round(time.time() * 1000))
-        timing_event.timestamp = timestamp
-        payload = pb_ping.SerializeToString()
-        message = self._routing_id + ' Ping ' + payload
-        LOGGER.info("message sent: " + repr(message))
-        self._push_socket.send(message)
+            self._process_devices()
+            self._process_handshake()
+            self.drain()
+
+    def _run_event_driven(self):
+        poller = self._build_poller()
+        reply_socket = self._handshake.socket
+        statistics = self._loop_statistics
+        next_report = monotonic() + self._report_interval
+        while not self._abort:
+            if (reply_socket is not self._handshake.socket):
+                # replaced after a Hello without reply
+                poller.unregister(reply_socket)
+                reply_socket = self._handshake.socket
+                poller.register(reply_socket, zmq.POLLIN)
+            before_poll = monotonic()
+            timeout = self._get_poll_timeout()
+            events = dict(poller.poll(int(timeout * 1000)))
+            after_poll = monotonic()
+            statistics.add_idle(after_poll - before_poll)
+            self._process_devices()
+            if ((reply_socket in events) or self._handshake.waiting):
+                self._process_handshake()
+            if (self._subscribe_socket in events):
+                self.drain()
+            now = monotonic()
+            statistics.add_busy(now - after_poll)
+            if (now >= next_report):
+                LOGGER.info(str(statistics))
+                if (self._input_scheduler):
+                    LOGGER.info(str(self._input_scheduler))
+                LOGGER.info(str(self._input_aggregator))
+                LOGGER.info(str(self._input_cache))
+                LOGGER.info(str(self._push_sender))
+                LOGGER.info(str(self._drain_statistics))
+                LOGGER.info(str(self._latency_monitor))
+                LOGGER.info(str(self._handshake))
+                statistics.reset()
+                next_report = now + self._report_interval
+
+    def _build_poller(self):
+        poller = zmq.Poller()
+        poller.register(self._subscribe_socket, zmq.POLLIN)
+        poller.register(self._handshake.socket, zmq.POLLIN)
+        for device in self._devices:
+            for source in device.poll_sources:
+                poller.register(source, zmq.POLLIN)
+        return poller
+
+    def _get_poll_timeout(self):
+        timeout = self._poll_timeout
+        for device in self._devices:
+            interval = device.poll_interval
+            if ((interval is not None) and (interval < timeout)):
+                timeout = interval
+        deadlines = [
+            self._latency_monitor.next_deadline,
+            self._handshake.next_deadline,
+            self._push_sender.next_deadline]
+        if (self._input_scheduler):
+            deadlines.append(self._input_scheduler.next_deadline)
+        for deadline in deadlines:
+            if (deadline is not None):
+                timeout = max(0, min(timeout, deadline - monotonic()))
+        return timeout
+
+    def _process_devices(self):
+        measure = self._instrumentation
+        running = (Runner.STATE_GAME_RUNNING == self._state)
+        for index, device in enumerate(self._devices):
+            started = measure.start()
+            device.process()
+            measure.stop(self._device_process_stage, started)
+
+            if ((running) and (device.has_new_values)):
+                started = measure.start()
+                input_ = device.build_input()
+                measure.stop(self._build_input_stage, started)
+                self._input_aggregator.update(index, input_)
+            if (device.read_ping()):
+                self._latency_monitor.ping()
+        if (running):
+            # at most one Input per tick whatever the number of devices
+            input_ = self._input_aggregator.build()
+            if (input_ is not None):
+                self._submit_input(input_)
+        if (self._input_scheduler):
+            self._input_scheduler.tick()
+        self._push_sender.tick()
+        self._latency_monitor.tick()
+
+    def _submit_input(self, input_):
+        if (self._input_scheduler):
+            self._input_scheduler.submit(input_)
+        else:
+            self._send_input(input_)
+
+    def _send_input(self, input_):
+        measure = self._instrumentation
+        started = measure.start()
+        self._push_sender.send_input(input_)
+        measure.stop(self._send_stage, started)
+        if (self._event_ring is not None):
+            self._event_ring.record(self._input_event, input_.left)
+
+    def _frame_input(self, input_):
+        # called by the sender when the input actually goes out
+        measure = self._instrumentation
+        started = measure.start()
+        framed = self._input_cache.get(input_)
+        measure.stop(self._serialize_stage, started)
+        return self._framing, framed
+
+    def _send_ping(self, payload):
+        LOGGER.debug("message sent: Ping %r", payload)
+        if (self._event_ring is not None):
+            self._event_ring.record(self._ping_event)
+        self._push_sender.send(self._framing, self._routing_id, "Ping", payload)
 
     def process(self):
         message_wrapper = self._receive()
         if (message_wrapper is None):
-            return
-        LOGGER.debug("[process]" +  self._state + " | " + str(message_wrapper))
-        if (("Pong" == message_wrapper.message_type) and
-                (self._routing_id == message_wrapper.recipient)):
-            self._decode_pong(message_wrapper)
-        if (Runner.STATE_WELCOME == self._state):
-            self._decode_game_state_init(message_wrapper)
-        elif (Runner.STATE_WAITING_GAME_START == self._state):
-            self._decode_game_state_start(message_wrapper)
-        elif (Runner.STATE_GAME_RUNNING == self._state):
-            self._decode_game_state_running(message_wrapper)
+            return False
+        self._dispatch(message_wrapper)
+        return True
+
+    def drain(self):
+        # handle every pending message (up to the budget) in one go
+        messages = []
+        while (len(messages) < self._drain_budget):
+            message_wrapper = self._receive()
+            if (message_wrapper is None):
+                break
+            messages.append(message_wrapper)
+        depth = len(messages)
+        self._drain_statistics.add_drain(depth, depth >= self._drain_budget)
+        newest_game_state = None
+        if (self._drop_stale_game_states):
+            for index, message_wrapper in enumerate(messages):
+                if ("GameState" == message_wrapper.message_type):
+                    newest_game_state = index
+        for index, message_wrapper in enumerate(messages):
+            if ((newest_game_state is not None) and
+                    (index != newest_game_state) and
+                    ("GameState" == message_wrapper.message_type)):
+                self._drain_statistics.add_dropped()
+                continue
+            self._dispatch(message_wrapper)
+        return depth
+
+    def replay(self, message_wrapper):
+        # handle a message that was not received on the SUB socket
+        self._dispatch(message_wrapper)
+
+    def _dispatch(self, message_wrapper):
+        LOGGER.debug("[process]%s | %s", self._state, message_wrapper)
+        message_type = message_wrapper.message_type
+        if (self._event_ring is not None):
+            code = self._receive_events.get(message_type)
+            if (code is None):
+                code = self._event_ring.register("receive " + message_type)
+                self._receive_events[message_type] = code
+            self._event_ring.record(code)
+        entry = self._handlers.get((self._state, message_type))
+        if (entry is None):
+            entry = self._handlers.get((Runner.ANY_STATE, message_type))
+        if (entry is not None):
+            handler, stage = entry
+            started = self._instrumentation.start()
+            handler(message_wrapper)
+            self._instrumentation.stop(stage, started)
 
     def _receive(self):
+        started = self._instrumentation.start()
         try:
-            message = self._subscribe_socket.recv(zmq.NOBLOCK)
-            if (message):
-                return MessageWrapper(message)
+            frames = self._subscribe_socket.recv_multipart(
+                zmq.NOBLOCK, copy=False)
+            if (self._capture is not None):
+                self._capture.write(frames)
+            return framing.unwrap(frames)
         except zmq.Again:
             pass
+        finally:
+            self._instrumentation.stop(self._receive_stage, started)
         # except zmq.Again as e:
             # LOGGER.debug("no message: " + str(e))
         return None
 
     def _build_hello(self, ready):
+        # imported here to keep start up fast
+        import orwell.messages.controller_pb2 as pb_controller
         pb_message = pb_controller.Hello()
         name = "JAMBON"
         pb_message.name = name
         pb_message.ready = ready
-        payload = pb_message.SerializeToString()
-        return self._routing_id + ' Hello ' + payload
+        return pb_message.SerializeToString()
 
     def _decode_pong(self, message_wrapper):
+        if (self._routing_id != message_wrapper.recipient):
+            return
         LOGGER.debug("_decode_pong")
-        self._ping = False
-        message = pb_robot.Pong()
-        message.ParseFromString(message_wrapper.payload)
-        LOGGER.info(
-                "Pong ; len(timing) = " + str(len(message.timing)))
-        for timing in message.timing:
-            timestamp = timing.timestamp
-            if (NAME == timing.logger):
-                timestamp_now = int(round(time.time() * 1000))
-                LOGGER.info("timestamp_now = " + str(timestamp_now))
-                LOGGER.info("timestamp = " + str(timestamp))
-                elapsed = timestamp_now - timestamp
-            else:
-                elapsed = timing.elapsed
-            LOGGER.info("'{logger}': @{timestamp} for {elapsed}".format(
-                logger=timing.logger,
-                timestamp=timestamp,
-                elapsed=elapsed))
+        message = message_wrapper.message
+        self._latency_monitor.handle_pong(message)
+        LOGGER.debug("Pong ; len(timing) = %d", len(message.timing))
 
     def _decode_hello_reply(self, message_wrapper, ready):
-        LOGGER.debug("_decode_hello_reply " +
-                      str(message_wrapper.message_type))
+        LOGGER.debug("_decode_hello_reply %s", message_wrapper.message_type)
         if ("Welcome" == message_wrapper.message_type):
-            self._handle_welcome(message_wrapper.payload, ready)
+            self._handle_welcome(message_wrapper.message, ready)
         elif ("Goodbye" == message_wrapper.message_type):
-            self._handle_goodbye(message_wrapper.payload)
+            self._handle_goodbye(message_wrapper.message)
         else:
             LOGGER.debug("Wrong message type: " +
                           message_wrapper.message_type)
 
-    def _handle_welcome(self, payload, ready):
-        message = pb_server_game.Welcome()
-        message.ParseFromString(payload)
+    def _handle_welcome(self, message, ready):
         new_routing_id = str(message.id)
         LOGGER.info(
                 "Welcome ; id = " + new_routing_id +
@@ -178,6 +591,7 @@ class Runner(object):
                 " ; team = '" + message.team + "'")
         self._robot = message.robot
         self._team = message.team
+        self._input_aggregator.reset()
         if (self._routing_id != new_routing_id):
             LOGGER.debug("update routing id to '" + new_routing_id + "'")
             # get rid of subscription to temporary routing id
@@ -187,6 +601,10 @@ class Runner(object):
             self._subscribe_socket.setsockopt(zmq.SUBSCRIBE, self._routing_id)
             # also listen to messages for all clients
             self._subscribe_socket.setsockopt(zmq.SUBSCRIBE, "all_clients")
+            # framed inputs embed the routing id
+            self._input_cache.reset(self._framing, self._routing_id)
+            if (self._prefill_input_cache):
+                self._input_cache.prefill()
         if (message.game_state):
             LOGGER.debug("decode game state")
             self._check_start_game(message.game_state)
@@ -195,25 +613,57 @@ class Runner(object):
         else:
             self._state = Runner.STATE_WELCOME
 
-    def _hello_and_reply(self, ready):
+    def _send_hello(self, ready, timeout=None, retries=None):
+        started = self._startup_profile.start()
         hello = self._build_hello(ready)
-        # print("send hello: " + repr(hello))
         LOGGER.info("send hello (ready=" + str(ready) + "): " + repr(hello))
-        self._reply_socket.send(hello)
-        reply = self._reply_socket.recv()
-        message_wrapper = MessageWrapper(reply)
-        self._decode_hello_reply(message_wrapper, ready)
+        self._hello_ready = ready
+        self._handshake.request(
+            self._framing, self._routing_id, hello, timeout, retries)
+        self._startup_profile.stop(startup.HANDSHAKE, started)
+
+    def _process_handshake(self):
+        message_wrapper = self._handshake.receive()
+        if (message_wrapper is not None):
+            self._negotiate_wire_format(message_wrapper)
+            self._decode_hello_reply(message_wrapper, self._hello_ready)
+            return
+        self._handshake.tick()
+        if ((self._handshake.failed) and (Runner.STATE_INIT != self._state)):
+            LOGGER.error("the server does not answer Hello, give up")
+            self._abort = True
+
+    def _wait_for_handshake(self):
+        # only used before the main loop starts, when there is nothing else
+        # to do
+        started = self._startup_profile.start()
+        while (self._handshake.waiting):
+            timeout = max(0, self._handshake.next_deadline - monotonic())
+            self._handshake.socket.poll(int(timeout * 1000), zmq.POLLIN)
+            self._process_handshake()
+        self._startup_profile.stop(startup.HANDSHAKE, started)
+        return (not self._handshake.failed)
+
+    def _negotiate_wire_format(self, message_wrapper):
+        if (framing.AUTO != self._wire_format):
+            return
+        if (message_wrapper.multipart):
+            LOGGER.info("server speaks multipart, switching wire format")
+            self._framing = framing.build_framing(framing.MULTIPART)
+        else:
+            self._framing = framing.build_framing(framing.SPACE_DELIMITED)
+        self._wire_format = self._framing.name
+        self._input_cache.reset(self._framing, self._routing_id)
 
 
     def _configure(self, game_state):
-        LOGGER.info("playing ? " + str(game_state.playing))
-        LOGGER.info("time left: " + str(game_state.seconds))
-        # self._update_running(game_state.playing)
-        for team in game_state.teams:
-            LOGGER.info(team.name + " (" + str(team.num_players) +
-                         ") -> " + str(team.score))
-        # let's assume we configure the different visualisations now
-        self._hello_and_reply(True)
+        # the subscribers of the store are notified of every field the first
+        # time
+        self._game_state_store.update(game_state)
+        # let's assume we configure the different visualisations now ; the
+        # reply is handled by the main loop
+        if (not self._handshake.waiting):
+            self._send_hello(True)
 
     def _check_start_game(self, game_state):
         LOGGER.info("_check_start_game: " + str(game_state.playing))
@@ -223,37 +673,51 @@ class Runner(object):
             self._state = Runner.STATE_WAITING_GAME_START
 
     def _decode_game_state_init(self, message_wrapper):
-        LOGGER.debug("_decode_game_state_init message is " + message_wrapper.message_type)
-        if ("GameState" == message_wrapper.message_type):
-            message = pb_server_game.GameState()
-            message.ParseFromString(message_wrapper.payload)
-            self._configure(message)
+        LOGGER.debug(
+            "_decode_game_state_init message is %s",
+            message_wrapper.message_type)
+        message = message_wrapper.message
+        self._configure(message)
 
     def _decode_game_state_start(self, message_wrapper):
-        if ("GameState" == message_wrapper.message_type):
-            message = pb_server_game.GameState()
-            message.ParseFromString(message_wrapper.payload)
-            self._check_start_game(message)
+        message = message_wrapper.message
+        self._game_state_store.update(message)
+        self._check_start_game(message)
 
     def _decode_game_state_running(self, message_wrapper):
-        if ("GameState" == message_wrapper.message_type):
-            message = pb_server_game.GameState()
-            message.ParseFromString(message_wrapper.payload)
-            self._update_visualisations(message)
-            if (not game_state.running):
-                self._state = Runner.STATE_WAITING_GAME_START
+        message = message_wrapper.message
+        self._update_visualisations(message)
+        if (not message.playing):
+            self._state = Runner.STATE_WAITING_GAME_START
+            # the next game starts without any Input sent yet
+            self._input_aggregator.reset()
 
     def _update_visualisations(self, game_state):
-        LOGGER.info("Updating visualisations")
+        diff = self._game_state_store.update(game_state)
+        if (diff):
+            LOGGER.debug("Updating visualisations %s", diff)
+
+    def _log_playing(self, playing, snapshot):
+        LOGGER.info("playing ? " + str(playing))
+
+    def _log_seconds(self, seconds, snapshot):
+        LOGGER.debug("time left: %s", seconds)
+
+    def _log_scores(self, scores, snapshot):
+        for name, score in scores.items():
+            LOGGER.info(name + " -> " + str(score))
+
+    def _log_teams(self, teams, snapshot):
+        for name, num_players in teams.items():
+            LOGGER.info(name + " (" + str(num_players) + ")")
 
-    def _handle_goodbye(self, payload):
-        message = pb_server_game.Goodbye()
-        message.ParseFromString(payload)
+    def _handle_goodbye(self, message):
         LOGGER.info("Goodbye ...")
         self._state = Runner.STATE_INIT
         self._abort = True
 
     def send_input(self, joystick, force_ping):
+        import orwell.messages.controller_pb2 as pb_controller
         if (joystick.has_new_values):
             pb_input = pb_controller.Input()
             pb_input.move.left = joystick.left
@@ -262,7 +726,7 @@ class Runner(object):
             pb_input.fire.weapon2 = joystick.fire_weapon2
             payload = pb_input.SerializeToString()
             message = self._routing_id + ' Input ' + payload
-            LOGGER.debug("message sent: " + repr(message))
+            LOGGER.debug("message sent: %r", message)
             self._push_socket.send(message)
             if (joystick.ping or force_ping):
                 pb_ping = pb_controller.Ping()
@@ -272,20 +736,10 @@ class Runner(object):
                 timing_event.timestamp = timestamp
                 payload = pb_ping.SerializeToString()
                 message = self._routing_id + ' Ping ' + payload
-                LOGGER.info("message sent: " + repr(message))
+                LOGGER.info("message sent: %r", message)
                 self._push_socket.send(message)
 
 def configure_logging(verbose):
     global LOGGER
-    print("runner.configure_logging")
-    LOGGER = logging.getLogger(__name__)
-    LOGGER.propagate = False
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-            '%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
-    handler.setFormatter(formatter)
-    LOGGER.addHandler(handler)
-    if (verbose):
-        LOGGER.setLevel(logging.DEBUG)
-    else:
-        LOGGER.setLevel(logging.INFO)
+    # records are formatted and written by the logging thread
+    LOGGER = async_logging.configure(__name__, verbose)
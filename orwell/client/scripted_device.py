@@ -0,0 +1,90 @@
+import collections
+
+from orwell.client.clock import monotonic
+from orwell.client.device import Device
+from orwell.client.input import Input
+
+
+def build_sweep(count, precision=0.025, fire_period=50):
+    # left and right go back and forth in opposite directions so that every
+    # sample is different from the previous one
+    steps = int(round(1 / precision))
+    samples = []
+    for index in range(count):
+        position = index % (4 * steps)
+        if (position > 2 * steps):
+            position = 4 * steps - position
+        value = (position - steps) * precision
+        fire = (0 == (index // fire_period) % 2)
+        samples.append((value, -value, fire, False, False))
+    return samples
+
+
+# Device replaying a list of (left, right, fire_weapon1, fire_weapon2, ping)
+# samples, one per call to process(). The time at which each new value was
+# produced is kept with the values so that benchmarks can measure input to
+# wire latency.
+class ScriptedDevice(Device):
+    MAX_TIMESTAMPS = 100000
+
+    def __init__(
+            self,
+            samples,
+            loop=True,
+            interval=None,
+            keep_timestamps=False):
+        assert(samples)
+        self._samples = samples
+        self._loop = loop
+        self._interval = interval
+        self._index = 0
+        self._current = None
+        self._has_new_values = False
+        self._ping = False
+        self._keep_timestamps = keep_timestamps
+        # only the most recent ones, a long run must not grow without bound
+        self._timestamps = collections.deque(
+            maxlen=ScriptedDevice.MAX_TIMESTAMPS)
+
+    @property
+    def timestamps(self):
+        return self._timestamps
+
+    @property
+    def finished(self):
+        return ((not self._loop) and (self._index >= len(self._samples)))
+
+    def process(self):
+        if (self._index >= len(self._samples)):
+            if (not self._loop):
+                self._has_new_values = False
+                return
+            self._index = 0
+        left, right, fire_weapon1, fire_weapon2, ping = \
+            self._samples[self._index]
+        self._index += 1
+        values = (left, right, fire_weapon1, fire_weapon2)
+        self._has_new_values = (self._current != values)
+        self._current = values
+        if (ping):
+            self._ping = True
+        if (self._has_new_values and self._keep_timestamps):
+            self._timestamps.append((monotonic(), values))
+
+    @property
+    def has_new_values(self):
+        return self._has_new_values
+
+    @property
+    def poll_interval(self):
+        return self._interval
+
+    def build_input(self):
+        return Input(*self._current)
+
+    def read_ping(self):
+        if (self._ping):
+            self._ping = False
+            return True
+        else:
+            return False
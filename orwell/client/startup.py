@@ -0,0 +1,67 @@
+from orwell.client.clock import monotonic
+
+IMPORTS = "imports"
+DEVICE_INIT = "device init"
+DISCOVERY = "discovery"
+CONNECT = "socket connect"
+HANDSHAKE = "handshake"
+PHASES = (IMPORTS, DEVICE_INIT, DISCOVERY, CONNECT, HANDSHAKE)
+
+
+# Time spent in each phase from the start of the process to the first
+# Welcome. Like Instrumentation, start() returns None when disabled so that
+# stop() costs nothing.
+class StartupProfile(object):
+    def __init__(self, enabled=False, started=None):
+        self._enabled = enabled
+        if (started is None):
+            started = monotonic()
+        self._started = started
+        self._durations = dict((phase, 0.0) for phase in PHASES)
+        self._finished = None
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @property
+    def durations(self):
+        return dict(self._durations)
+
+    @property
+    def total(self):
+        if (self._finished is None):
+            return monotonic() - self._started
+        return self._finished - self._started
+
+    def start(self):
+        if (self._enabled):
+            return monotonic()
+        return None
+
+    def stop(self, phase, started):
+        if (started is None):
+            return
+        self.add(phase, monotonic() - started)
+
+    def add(self, phase, duration):
+        self._durations[phase] = self._durations.get(phase, 0.0) + duration
+
+    def finish(self):
+        # later calls to start() and stop() are ignored
+        self._finished = monotonic()
+        self._enabled = False
+
+    def __str__(self):
+        total = self.total
+        lines = ["startup: {0:.1f} ms".format(total * 1000)]
+        phases = list(PHASES) + sorted(set(self._durations) - set(PHASES))
+        accounted = 0.0
+        for phase in phases:
+            duration = self._durations[phase]
+            accounted += duration
+            lines.append("  {0:<16} {1:>8.1f} ms".format(
+                phase, duration * 1000))
+        lines.append("  {0:<16} {1:>8.1f} ms".format(
+            "other", (total - accounted) * 1000))
+        return "\n".join(lines)
@@ -0,0 +1,93 @@
+import socket
+import threading
+import unittest
+
+import zmq
+
+from orwell.client import broadcast
+from orwell.client import fake_server
+from orwell.client.broadcast import Discovery
+from orwell.client.fake_server import FakeServer
+
+
+def get_free_port():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+class DiscoveryTest(unittest.TestCase):
+    def setUp(self):
+        broadcast.configure_logging(False)
+        fake_server.configure_logging(False)
+        self.port = get_free_port()
+        self.server = FakeServer(
+            push_address="inproc://discovery-test-push",
+            subscribe_address="inproc://discovery-test-subscribe",
+            reply_address="inproc://discovery-test-reply",
+            discovery_port=self.port,
+            game_state_rate=None,
+            context=zmq.Context.instance())
+        self.server.start()
+        # probe the fake server only, not the whole network
+        self.get_broadcast_addresses = broadcast.get_broadcast_addresses
+        broadcast.get_broadcast_addresses = lambda: ["127.0.0.1"]
+
+    def tearDown(self):
+        broadcast.get_broadcast_addresses = self.get_broadcast_addresses
+        self.server.stop()
+
+    def test_fake_server_answers(self):
+        discovery = Discovery(port=self.port, timeout=5.0)
+        addresses = discovery.start().result(5.0)
+        self.assertEqual(
+            (
+                "inproc://discovery-test-push",
+                "inproc://discovery-test-subscribe",
+                "inproc://discovery-test-reply"),
+            addresses)
+        self.assertEqual("127.0.0.1", discovery.sender[0])
+        self.assertEqual(1, self.server.discoveries)
+
+    def test_window_measures_round_trip(self):
+        discovery = Discovery(
+            port=self.port, timeout=5.0, window=0.1, round_trip_probes=0)
+        discovery.start().result(5.0)
+        candidates = discovery.candidates
+        self.assertEqual(1, len(candidates))
+        # given by the reply to the broadcast probe alone
+        self.assertIsNotNone(candidates[0].round_trip)
+        self.assertEqual(
+            "inproc://discovery-test-push", candidates[0].push_address)
+
+    def test_round_trip_probes(self):
+        discovery = Discovery(
+            port=self.port, timeout=5.0, window=0.1, round_trip_probes=2)
+        discovery.start().result(5.0)
+        self.assertIsNotNone(discovery.candidates[0].round_trip)
+        # the broadcast probe and the two unicast ones
+        self.assertEqual(3, self.server.discoveries)
+
+    def test_round_trip_ignores_other_replies(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(5.0)
+        addresses = ("tcp://a:1", "tcp://a:2", "tcp://a:3")
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            broadcast.measure_round_trip(
+                server.getsockname(), addresses, 0.5)))
+        thread.start()
+        try:
+            _, prober = server.recvfrom(512)
+            # the reply of another server
+            server.sendto(
+                fake_server.build_discovery_reply(
+                    "tcp://b:1", "tcp://b:2", "tcp://b:3"),
+                prober)
+        finally:
+            thread.join()
+            server.close()
+        self.assertEqual([None], results)
@@ -0,0 +1,27 @@
+import unittest
+
+from orwell.client.game_state_store import GameStateSnapshot
+
+
+class Team(object):
+    def __init__(self, name, num_players, score):
+        self.name = name
+        self.num_players = num_players
+        self.score = score
+
+
+class GameState(object):
+    def __init__(self, playing, seconds, teams):
+        self.playing = playing
+        self.seconds = seconds
+        self.teams = teams
+
+
+class GameStateSnapshotTest(unittest.TestCase):
+    def test_str(self):
+        snapshot = GameStateSnapshot(GameState(
+            True, 42, [Team("red", 2, 3), Team("blue", 1, 0)]))
+        self.assertEqual(
+            "(game state, playing = True; seconds = 42; teams = "
+            "blue (players = 1, score = 0), red (players = 2, score = 3))",
+            str(snapshot))
@@ -0,0 +1,51 @@
+import unittest
+
+import zmq
+
+from orwell.client import framing
+from orwell.client import handshake
+from orwell.client.handshake import Handshake
+
+
+class HandshakeTest(unittest.TestCase):
+    def setUp(self):
+        handshake.configure_logging(False)
+        self.context = zmq.Context()
+        self.replier = self.context.socket(zmq.REP)
+        self.replier.bind("inproc://handshake-test")
+        self.handshake = Handshake(self.context, timeout=1.0, retries=1)
+        self.handshake.connect("inproc://handshake-test")
+        self.framing = framing.build_framing(framing.SPACE_DELIMITED)
+
+    def tearDown(self):
+        self.handshake.close()
+        self.replier.close(0)
+        self.context.term()
+
+    def reply(self, frames):
+        self.assertTrue(self.replier.poll(1000))
+        self.replier.recv_multipart()
+        self.replier.send_multipart(frames)
+        self.assertTrue(self.handshake.socket.poll(1000))
+
+    def test_welcome(self):
+        self.handshake.request(self.framing, "id", b"hello", now=0.0)
+        self.reply([b"id Welcome payload"])
+        message_wrapper = self.handshake.receive(now=0.5)
+        self.assertEqual("Welcome", message_wrapper.message_type)
+        self.assertEqual(handshake.DONE, self.handshake.state)
+        self.assertEqual(1, self.handshake.attempts)
+
+    def test_empty_reply_is_retried(self):
+        self.handshake.request(self.framing, "id", b"hello", now=0.0)
+        self.reply([b""])
+        self.assertIsNone(self.handshake.receive(now=0.5))
+        # sent again at once
+        self.assertTrue(self.handshake.waiting)
+        self.assertEqual(2, self.handshake.attempts)
+        self.assertEqual(1, self.handshake.failures)
+        self.assertEqual(1.5, self.handshake.next_deadline)
+        self.reply([b""])
+        self.assertIsNone(self.handshake.receive(now=0.6))
+        # no retry left
+        self.assertTrue(self.handshake.failed)
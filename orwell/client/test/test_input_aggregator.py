@@ -0,0 +1,76 @@
+import unittest
+
+from orwell.client import input_aggregator
+from orwell.client.input import Input
+from orwell.client.input_aggregator import InputAggregator
+
+
+def values(input_):
+    return (
+        input_.left, input_.right, input_.fire_weapon1, input_.fire_weapon2)
+
+
+class InputAggregatorTest(unittest.TestCase):
+    def test_single_device(self):
+        aggregator = InputAggregator(1)
+        self.assertIsNone(aggregator.build())
+        input_ = Input(0.5, 0.5, False, False)
+        aggregator.update(0, input_, now=1.0)
+        self.assertIs(input_, aggregator.build())
+        # nothing new
+        self.assertIsNone(aggregator.build())
+        # same values again
+        aggregator.update(0, Input(0.5, 0.5, False, False), now=2.0)
+        self.assertIsNone(aggregator.build())
+        self.assertEqual([2.0], aggregator.timestamps)
+
+    def test_reset(self):
+        aggregator = InputAggregator(1)
+        aggregator.update(0, Input(0.5, 0.5, False, False))
+        self.assertIsNotNone(aggregator.build())
+        aggregator.reset()
+        # same values as the last Input of the previous game
+        input_ = Input(0.5, 0.5, False, False)
+        aggregator.update(0, input_)
+        self.assertIs(input_, aggregator.build())
+
+    def test_one_input_per_tick(self):
+        aggregator = InputAggregator(2)
+        aggregator.update(0, Input(0.1, 0.1, False, False))
+        aggregator.update(1, Input(0.2, 0.2, False, False))
+        aggregator.update(0, Input(0.3, 0.3, False, False))
+        self.assertIsNotNone(aggregator.build())
+        self.assertIsNone(aggregator.build())
+        self.assertEqual(1, aggregator.combined)
+        self.assertEqual(2, aggregator.merged)
+
+    def test_override_axes(self):
+        aggregator = InputAggregator(2, axis_policy=input_aggregator.OVERRIDE)
+        aggregator.update(0, Input(0, 0, False, False))
+        aggregator.update(1, Input(-0.4, 0.2, False, False))
+        # the first device is at rest
+        self.assertEqual((-0.4, 0.2, False, False), values(aggregator.build()))
+        aggregator.update(0, Input(0.1, 0, False, False))
+        self.assertEqual((0.1, 0, False, False), values(aggregator.build()))
+
+    def test_max_magnitude_axes(self):
+        aggregator = InputAggregator(
+            2, axis_policy=input_aggregator.MAX_MAGNITUDE)
+        aggregator.update(0, Input(0.3, 0.9, False, False))
+        aggregator.update(1, Input(-0.5, 0.1, False, False))
+        self.assertEqual((-0.5, 0.9, False, False), values(aggregator.build()))
+
+    def test_or_buttons(self):
+        aggregator = InputAggregator(2, button_policy=input_aggregator.OR)
+        aggregator.update(0, Input(0, 0, True, False))
+        aggregator.update(1, Input(0, 0, False, True))
+        self.assertEqual((0, 0, True, True), values(aggregator.build()))
+
+    def test_override_buttons(self):
+        aggregator = InputAggregator(
+            2, button_policy=input_aggregator.OVERRIDE)
+        aggregator.update(0, Input(0, 0, False, False))
+        aggregator.update(1, Input(0, 0, False, True))
+        self.assertEqual((0, 0, False, True), values(aggregator.build()))
+        aggregator.update(0, Input(0, 0, True, False))
+        self.assertEqual((0, 0, True, False), values(aggregator.build()))
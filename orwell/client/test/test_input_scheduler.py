@@ -0,0 +1,52 @@
+import unittest
+
+from orwell.client.input import Input
+from orwell.client.input_scheduler import InputScheduler
+
+
+class InputSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        # 10 inputs per second, one every 0.1 s
+        self.scheduler = InputScheduler(self.sent.append, 10)
+
+    def test_first_input_is_sent_at_once(self):
+        input_ = Input(0.5, 0.5, False, False)
+        self.scheduler.submit(input_, now=0.0)
+        self.assertEqual([input_], self.sent)
+        self.assertIsNone(self.scheduler.next_deadline)
+
+    def test_rate_limited_and_coalesced(self):
+        self.scheduler.submit(Input(0.1, 0.1, False, False), now=0.0)
+        self.scheduler.submit(Input(0.2, 0.2, False, False), now=0.01)
+        newest = Input(0.3, 0.3, False, False)
+        self.scheduler.submit(newest, now=0.02)
+        self.assertEqual(1, len(self.sent))
+        self.assertAlmostEqual(0.1, self.scheduler.next_deadline)
+        self.scheduler.tick(now=0.05)
+        self.assertEqual(1, len(self.sent))
+        self.scheduler.tick(now=0.1)
+        self.assertEqual(2, len(self.sent))
+        self.assertIs(newest, self.sent[-1])
+        self.assertEqual(1, self.scheduler.coalesced)
+        self.assertIsNone(self.scheduler.next_deadline)
+
+    def test_button_change_is_sent_immediately(self):
+        self.scheduler.submit(Input(0.1, 0.1, False, False), now=0.0)
+        pressed = Input(0.1, 0.1, True, False)
+        self.scheduler.submit(pressed, now=0.01)
+        self.assertIs(pressed, self.sent[-1])
+        released = Input(0.1, 0.1, True, True)
+        self.scheduler.submit(released, now=0.02)
+        self.assertIs(released, self.sent[-1])
+        self.assertEqual(3, len(self.sent))
+        # 2 button edges plus the first input
+        self.assertEqual(3, self.scheduler.edges)
+
+    def test_same_buttons_wait_for_the_period(self):
+        self.scheduler.submit(Input(0.1, 0.1, True, False), now=0.0)
+        self.scheduler.submit(Input(0.2, 0.2, True, False), now=0.01)
+        self.assertEqual(1, len(self.sent))
+        self.scheduler.submit(Input(0.3, 0.3, True, False), now=0.11)
+        self.assertEqual(2, len(self.sent))
+        self.assertEqual(0.3, self.sent[-1].left)
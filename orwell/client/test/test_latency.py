@@ -0,0 +1,72 @@
+import unittest
+
+from orwell.client.latency import Histogram
+from orwell.client.latency import LatencyMonitor
+
+
+class Timing(object):
+    def __init__(self, logger, elapsed=0):
+        self.logger = logger
+        self.elapsed = elapsed
+
+
+class Pong(object):
+    def __init__(self, *timing):
+        self.timing = timing
+
+
+class HistogramTest(unittest.TestCase):
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean)
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        # 1 ms to 100 ms
+        for value in range(1, 101):
+            histogram.record(value / 1000.0)
+        self.assertEqual(100, histogram.count)
+        # 16 buckets per octave: within 5% above the exact value
+        for percent in (50, 95, 99):
+            expected = percent / 1000.0
+            value = histogram.percentile(percent)
+            self.assertTrue(expected <= value <= expected * 1.05, value)
+        self.assertEqual(0.1, histogram.percentile(100))
+        self.assertEqual(0.001, histogram.min)
+        self.assertAlmostEqual(0.0505, histogram.mean)
+
+    def test_percentile_is_bounded_by_max(self):
+        histogram = Histogram()
+        histogram.record(0.0123)
+        self.assertEqual(0.0123, histogram.percentile(50))
+        self.assertEqual(0.0123, histogram.percentile(99))
+
+    def test_out_of_range(self):
+        histogram = Histogram(lowest=0.001, highest=1.0)
+        histogram.record(0.0)
+        histogram.record(100.0)
+        self.assertEqual(0.0, histogram.min)
+        self.assertEqual(100.0, histogram.percentile(100))
+
+    def test_merge(self):
+        first = Histogram()
+        second = Histogram()
+        for value in range(1, 51):
+            first.record(value / 1000.0)
+        for value in range(51, 101):
+            second.record(value / 1000.0)
+        first.merge(second)
+        self.assertEqual(100, first.count)
+        self.assertEqual(0.1, first.max)
+        self.assertTrue(0.05 <= first.percentile(50) <= 0.05 * 1.05)
+
+
+class LatencyMonitorTest(unittest.TestCase):
+    def test_foreign_logger_is_ignored(self):
+        monitor = LatencyMonitor(lambda payload: None, "client")
+        monitor.handle_pong(Pong(
+            Timing("client/not a number"),
+            Timing("server", elapsed=2)))
+        self.assertEqual(0, monitor.round_trip.count)
+        self.assertEqual(1, monitor.hops["server"].count)
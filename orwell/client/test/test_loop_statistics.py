@@ -0,0 +1,33 @@
+import unittest
+
+from orwell.client.loop_statistics import DrainStatistics
+from orwell.client.loop_statistics import LoopStatistics
+
+
+class LoopStatisticsTest(unittest.TestCase):
+    def test_ratios(self):
+        statistics = LoopStatistics()
+        self.assertEqual(0.0, statistics.idle_ratio)
+        statistics.add_idle(3.0)
+        statistics.add_busy(1.0)
+        statistics.add_busy(0.0)
+        self.assertEqual(2, statistics.wakeups)
+        self.assertAlmostEqual(0.75, statistics.idle_ratio)
+        self.assertAlmostEqual(0.25, statistics.busy_ratio)
+        statistics.reset()
+        self.assertEqual(0, statistics.wakeups)
+        self.assertEqual(0.0, statistics.busy_ratio)
+
+
+class DrainStatisticsTest(unittest.TestCase):
+    def test_depths(self):
+        statistics = DrainStatistics()
+        statistics.add_drain(3, False)
+        statistics.add_drain(10, True)
+        statistics.add_drain(1, False)
+        statistics.add_dropped()
+        self.assertEqual(14, statistics.received)
+        self.assertEqual(1, statistics.dropped)
+        self.assertEqual(1, statistics.last_depth)
+        self.assertEqual(10, statistics.max_depth)
+        self.assertEqual(1, statistics.budget_exhausted)
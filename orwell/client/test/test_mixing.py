@@ -0,0 +1,87 @@
+import math
+import random
+import unittest
+
+from orwell.client import mixing
+from orwell.client.mixing import MixingEngine
+from orwell.client.mixing import ResponseCurve
+
+
+def convert(x, y, factor, angle, precision, dead_zone):
+    # Joystick._convert before the MixingEngine
+    def round_(value):
+        new_value = int(value / precision) * precision
+        if (math.fabs(new_value) < dead_zone):
+            new_value = 0
+        return new_value
+    cosine = math.cos(angle)
+    sine = math.sin(angle)
+    scale = (cosine + sine) * 0.5
+    big_left = round_(factor * (x * cosine + y * sine) / scale)
+    big_right = round_(factor * (y * cosine - x * sine) / scale)
+    return max(-1, min(1, big_left)), max(-1, min(1, big_right))
+
+
+def build_samples(count):
+    generator = random.Random(1)
+    samples = []
+    for _ in range(count):
+        samples.append((
+            generator.uniform(-1, 1),
+            generator.uniform(-1, 1),
+            generator.uniform(-1, 1)))
+    # values on the precision grid, where truncation is the most fragile
+    for x in range(-40, 41, 3):
+        for y in range(-40, 41, 3):
+            samples.append((x * 0.025, y * 0.025, 1.0))
+    return samples
+
+
+class MixingEngineTest(unittest.TestCase):
+    def test_linear_curves_match_the_original_conversion(self):
+        samples = build_samples(20000)
+        for angle, dead_zone in ((math.pi * 0.25, 0.05), (0.7, 0.0)):
+            mixer = MixingEngine(angle, 0.025, dead_zone)
+            for x, y, factor in samples:
+                self.assertEqual(
+                    convert(x, y, factor, angle, 0.025, dead_zone),
+                    mixer.mix(x, y, factor))
+
+    def test_axis_positions_match_the_original_conversion(self):
+        # every output step is read from the table of levels except close
+        # to a step, where the original formula is used
+        positions = [value / 32767.0 for value in range(-32767, 32768, 331)]
+        for angle in (0.1, 1.0, 2.0):
+            mixer = MixingEngine(angle, 0.025, 0.1)
+            for x in positions:
+                for y in positions:
+                    self.assertEqual(
+                        convert(x, y, 1.0, angle, 0.025, 0.1),
+                        mixer.mix(x, y, 1.0))
+
+    def test_angle_change(self):
+        mixer = MixingEngine(math.pi * 0.25, 0.025, 0.05)
+        mixer.angle = 0.7
+        self.assertEqual(
+            convert(0.3, -0.6, 1.0, 0.7, 0.025, 0.05),
+            mixer.mix(0.3, -0.6, 1.0))
+
+    def test_batch_matches_mix(self):
+        samples = build_samples(2000)
+        mixer = MixingEngine(
+            0.7,
+            0.025,
+            0.05,
+            x_curve=ResponseCurve(dead_zone=0.02, expo=0.3))
+        lefts, rights = mixer.mix_batch(*zip(*samples))
+        for index, sample in enumerate(samples):
+            self.assertEqual(
+                mixer.mix(*sample), (lefts[index], rights[index]))
+
+    def test_curve(self):
+        curve = ResponseCurve(dead_zone=0.1, expo=1.0)
+        self.assertEqual(0.0, curve(0.05))
+        self.assertEqual(-1.0, curve(-1.0))
+        self.assertAlmostEqual(0.125, curve(0.55))
+        self.assertTrue(mixing.LINEAR.linear)
+        self.assertFalse(curve.linear)
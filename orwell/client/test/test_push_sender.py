@@ -0,0 +1,131 @@
+import unittest
+
+import zmq
+
+from orwell.client import push_sender
+from orwell.client.input import Input
+from orwell.client.push_sender import PushSender
+
+
+class FakeSocket(object):
+    def __init__(self):
+        self.full = False
+        self.sent = []
+        self.options = {}
+
+    def setsockopt(self, option, value):
+        self.options[option] = value
+
+
+class FakeFraming(object):
+    def send_framed(self, socket, framed, flags=0):
+        if (socket.full):
+            if (flags & zmq.NOBLOCK):
+                raise zmq.Again()
+            raise AssertionError("a blocking send would hang")
+        socket.sent.append((framed.left, framed.fire_weapon1))
+
+    def send(self, socket, routing_id, message_type, payload, flags=0):
+        if (socket.full):
+            raise zmq.Again()
+        socket.sent.append(message_type)
+
+
+def build(policy, high_water_mark=None):
+    socket = FakeSocket()
+    framing = FakeFraming()
+    sender = PushSender(
+        socket,
+        lambda input_: (framing, input_),
+        policy=policy,
+        high_water_mark=high_water_mark)
+    return socket, framing, sender
+
+
+class PushSenderTest(unittest.TestCase):
+    def test_default_blocks(self):
+        socket = FakeSocket()
+        framing = FakeFraming()
+        sender = PushSender(socket, lambda input_: (framing, input_))
+        self.assertEqual(push_sender.BLOCK, sender.policy)
+        sender.send_input(Input(0.1, 0, False, False), now=1.0)
+        self.assertEqual([(0.1, False)], socket.sent)
+        self.assertEqual(1, sender.sent)
+        self.assertEqual(0, sender.pending)
+        self.assertIsNone(sender.next_deadline)
+
+    def test_high_water_mark(self):
+        socket, _, _ = build(push_sender.DROP_OLDEST, high_water_mark=4)
+        self.assertEqual({zmq.SNDHWM: 4}, socket.options)
+        socket, _, _ = build(push_sender.DROP_OLDEST)
+        self.assertEqual({}, socket.options)
+
+    def test_drop_oldest(self):
+        socket, _, sender = build(push_sender.DROP_OLDEST)
+        socket.full = True
+        sender.send_input(Input(0.1, 0, False, False), now=1.0)
+        sender.send_input(Input(0.2, 0, True, False), now=1.001)
+        sender.send_input(Input(0.3, 0, False, False), now=1.002)
+        self.assertEqual([], socket.sent)
+        self.assertEqual(1, sender.pending)
+        self.assertEqual(2, sender.dropped)
+        socket.full = False
+        sender.flush(now=1.01)
+        # the button press was superseded
+        self.assertEqual([(0.3, False)], socket.sent)
+        self.assertEqual(0, sender.pending)
+        self.assertAlmostEqual(0.01, sender.blocked_time)
+
+    def test_deliver_buttons(self):
+        socket, _, sender = build(push_sender.DELIVER_BUTTONS)
+        sender.send_input(Input(0.0, 0, False, False), now=1.0)
+        socket.full = True
+        sender.send_input(Input(0.1, 0, False, False), now=1.001)
+        sender.send_input(Input(0.2, 0, False, False), now=1.002)
+        sender.send_input(Input(0.3, 0, True, False), now=1.003)
+        sender.send_input(Input(0.4, 0, True, False), now=1.004)
+        sender.send_input(Input(0.5, 0, False, False), now=1.005)
+        sender.send_input(Input(0.6, 0, False, False), now=1.006)
+        self.assertEqual(3, sender.pending)
+        socket.full = False
+        sender.flush(now=1.01)
+        # every change of the buttons arrives, in order, followed by the
+        # newest axes
+        self.assertEqual(
+            [(0.0, False), (0.3, True), (0.5, False), (0.6, False)],
+            socket.sent)
+        self.assertEqual(3, sender.dropped)
+        self.assertEqual(0, sender.pending)
+
+    def test_retry(self):
+        socket, _, sender = build(push_sender.DROP_OLDEST)
+        socket.full = True
+        sender.send_input(Input(0.1, 0, False, False), now=1.0)
+        deadline = sender.next_deadline
+        self.assertAlmostEqual(1.0 + PushSender.RETRY_INTERVAL, deadline)
+        socket.full = False
+        # too early, nothing is tried
+        sender.tick(now=1.0)
+        self.assertEqual([], socket.sent)
+        sender.tick(now=deadline)
+        self.assertEqual([(0.1, False)], socket.sent)
+        self.assertIsNone(sender.next_deadline)
+
+    def test_failed_retry_moves_deadline(self):
+        socket, _, sender = build(push_sender.DROP_OLDEST)
+        socket.full = True
+        sender.send_input(Input(0.1, 0, False, False), now=1.0)
+        sender.tick(now=2.0)
+        self.assertAlmostEqual(
+            2.0 + PushSender.RETRY_INTERVAL, sender.next_deadline)
+        self.assertEqual(1, sender.pending)
+
+    def test_pings_dropped(self):
+        socket, framing, sender = build(push_sender.DELIVER_BUTTONS)
+        self.assertTrue(sender.send(framing, b"id", b"Ping", b""))
+        socket.full = True
+        self.assertFalse(sender.send(framing, b"id", b"Ping", b""))
+        self.assertEqual([b"Ping"], socket.sent)
+        self.assertEqual(1, sender.dropped_pings)
+        # pings are never held back
+        self.assertEqual(0, sender.pending)
@@ -0,0 +1,38 @@
+import unittest
+
+from orwell.client import broadcast
+from orwell.client import framing
+from orwell.client import runner as runner_module
+from orwell.client.broadcast import Discovery
+from orwell.client.clock import monotonic
+from orwell.client.runner import Runner
+from orwell.client.test.test_discovery import get_free_port
+
+
+class RunnerTest(unittest.TestCase):
+    def test_conflate_needs_single_frames(self):
+        for wire_format in (framing.MULTIPART, framing.AUTO):
+            with self.assertRaises(ValueError):
+                Runner(
+                    [],
+                    push_address="inproc://runner-test-push",
+                    subscribe_address="inproc://runner-test-subscribe",
+                    reply_address="inproc://runner-test-reply",
+                    wire_format=wire_format,
+                    stale_game_states=runner_module.CONFLATE_GAME_STATES)
+
+    def test_discovery_does_not_block_init(self):
+        runner_module.configure_logging(False)
+        broadcast.configure_logging(False)
+        get_broadcast_addresses = broadcast.get_broadcast_addresses
+        broadcast.get_broadcast_addresses = lambda: ["127.0.0.1"]
+        discovery = Discovery(port=get_free_port(), timeout=5.0)
+        try:
+            started = monotonic()
+            runner = Runner([], discovery=discovery)
+            self.assertLess(monotonic() - started, 1.0)
+            self.assertFalse(discovery.done())
+            runner.destroy()
+        finally:
+            discovery.cancel()
+            broadcast.get_broadcast_addresses = get_broadcast_addresses
@@ -29,6 +29,12 @@ setuptools.setup(
         'pynput',
         'pyzmq',
         ],
+    extras_require={
+        # broadcast discovery on every network interface
+        'discovery': ['netifaces'],
+        # vectorized mixing of recorded samples
+        'batch': ['numpy'],
+        },
     tests_require=['nose', 'coverage', ],
     entry_points={},
     classifiers=[